@@ -0,0 +1,152 @@
+"""Offline load test for Quizzicle's game flows against the in-memory Firestore.
+
+Simulates a host and N players stepping through a full quiz: a join storm, autorefresh polling,
+answer bursts, question advances and the final scoring, in instructor-paced and/or timed mode.
+Reports Firestore reads and writes per second, transaction retries and p50/p99 latency per
+operation, so storage and scaling changes can be compared without a live project.
+
+    python benchmark.py --players 200 --questions 30 --latency-ms 5
+    python benchmark.py --modes timed_paced --json > bench.json
+    python benchmark.py --metrics prometheus > metrics.prom
+    python benchmark.py --replicas 4    # sessions spread over 4 backends sharing one coordinator
+    python benchmark.py --listener-delay-ms 50    # listeners lag writes; scores must still add up
+
+Every run checks the published results against the answers the simulated players gave.
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from coordination import LocalCoordinator
+from game_backend import QuizBackend
+from memory_firestore import MemoryClient
+from metrics import REGISTRY
+
+class LatencyRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def time(self, op, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock: self.samples[op].append(elapsed)
+
+    def summary(self):
+        return {op: {"count": len(s), "p50_ms": float(np.percentile(s, 50)) * 1000, "p99_ms": float(np.percentile(s, 99)) * 1000}
+                for op, s in sorted(self.samples.items())}
+
+def make_quiz(num_questions):
+    blocks = [f"Q: Question {i}?\nO: A{i}\nO: B{i}\nO: C{i}\nO: D{i}\nA: {random.choice('ABCD')}{i}" for i in range(num_questions)]
+    return io.BytesIO("\n\n".join(blocks).encode("utf-8"))
+
+def check_results(db, game_pin, quiz_mode, expected_scores, expected_correct):
+    """Compares the published scores and per-question stats with what the players actually answered."""
+    game_ref = db.collection("games").document(game_pin)
+    results = game_ref.collection("content").document("results").get().to_dict()
+    if quiz_mode == "timed_paced": scores = results["scores"]
+    else: scores = {(data := doc.to_dict()).get("name", doc.id): data.get("score", 0) for doc in game_ref.collection("players").stream()}
+    wrong = {name: (scores.get(name), score) for name, score in expected_scores.items() if scores.get(name) != score}
+    assert not wrong, f"{len(wrong)} players scored wrong (got, expected), e.g. {list(wrong.items())[:3]}"
+    correct = [stats["correct"] for stats in results["question_stats"]]
+    assert correct == expected_correct, f"question stats {correct} != {expected_correct}"
+
+def run_game(quiz_mode, num_players, num_questions, poll_ticks, latency, workers, timer=0, replicas=1, listener_delay=0.0):
+    db, coordinator = MemoryClient(latency=latency, listener_delay=listener_delay), LocalCoordinator() if replicas > 1 else None
+    replica_backends, timings = [QuizBackend(db, coordinator=coordinator) for _ in range(replicas)], LatencyRecorder()
+    backend = replica_backends[0]  # The host's replica.
+    bank_id, questions = backend.banks.compile_upload(make_quiz(num_questions))
+    scheduled = quiz_mode == "timed_paced" and timer > 0
+    game_pin = backend.create_game_session("host", bank_id, len(questions), quiz_mode, (timer or 60) if quiz_mode == "timed_paced" else None)
+    players = [f"player-{i}" for i in range(num_players)]
+    player_backend = {name: replica_backends[i % replicas] for i, name in enumerate(players)}
+    answered = {}  # (player, question index) -> answered correctly
+    db.stats.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        joined = list(pool.map(lambda name: timings.time("join_game", player_backend[name].join_game, game_pin, name), players))
+        assert all(ok for ok, _ in joined), [msg for ok, msg in joined if not ok][:3]
+
+        def poll(session_id):
+            return timings.time("get_game_state", player_backend.get(session_id, backend).get_game_state, game_pin, session_id)
+
+        def player_tick(name, live_idx):
+            state = poll(name)
+            # A follower may still show the last question: players answer the live one once, as soon as they see it.
+            if state["status"] == "in_progress" and state["current_question_index"] == live_idx and (name, live_idx) not in answered:
+                q_idx = live_idx
+                question = player_backend[name].get_quiz_questions(game_pin)[q_idx]
+                option = random.randrange(len(question.options))
+                correct = quiz_mode == "instructor_paced" and option == question.answer_index
+                timings.time("submit_answer", player_backend[name].submit_answer, game_pin, name, q_idx, option, correct=correct)
+                answered[name, q_idx] = option == question.answer_index
+
+        poll("host")
+        timings.time("start_game", backend.start_game, game_pin, quiz_mode)
+        for q_idx in range(num_questions):
+            for tick in range(poll_ticks):
+                list(pool.map(lambda name: player_tick(name, q_idx), players))
+                poll("host")
+            if scheduled:
+                # Let the scheduler close the question; players keep polling as their autorefresh would.
+                while (state := poll("host"))["status"] == "in_progress" and state["current_question_index"] == q_idx:
+                    time.sleep(0.05)
+            else:
+                timings.time("advance_question", backend.advance_question, game_pin, q_idx)
+        list(pool.map(poll, players))
+        assert poll("host")["status"] == "finished"
+    elapsed = time.perf_counter() - started
+    stats = db.stats.snapshot()
+    check_results(db, game_pin, quiz_mode, {name: sum(answered.get((name, q), False) for q in range(num_questions)) for name in players},
+                  [sum(answered.get((name, q), False) for name in players) for q in range(num_questions)])
+    return {
+        "mode": quiz_mode, "players": num_players, "questions": num_questions, "replicas": replicas, "seconds": elapsed,
+        "reads": stats["reads"] + stats["listener_reads"], "writes": stats["writes"],
+        "reads_per_s": (stats["reads"] + stats["listener_reads"]) / elapsed, "writes_per_s": stats["writes"] / elapsed,
+        "commits": stats["commits"], "transaction_retries": stats["transaction_retries"],
+        "latency": timings.summary(),
+    }
+
+def print_report(result):
+    print(f"\n== {result['mode']}: {result['players']} players x {result['questions']} questions on {result['replicas']} replica(s) in {result['seconds']:.2f}s ==")
+    print(f"reads {result['reads']} ({result['reads_per_s']:.1f}/s)  writes {result['writes']} ({result['writes_per_s']:.1f}/s)  "
+          f"commits {result['commits']}  transaction retries {result['transaction_retries']}")
+    print(f"{'operation':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for op, row in result["latency"].items():
+        print(f"{op:<20}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=150)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=["instructor_paced", "timed_paced"], choices=["instructor_paced", "timed_paced"])
+    parser.add_argument("--poll-ticks", type=int, default=3, help="autorefresh polls per player per question")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated round trip per Firestore RPC")
+    parser.add_argument("--workers", type=int, default=32, help="concurrent simulated clients")
+    parser.add_argument("--timer", type=int, default=0, help="seconds per timed question; 0 makes the host skip each timer")
+    parser.add_argument("--replicas", type=int, default=1, help="backends sharing one coordinator, with players spread across them")
+    parser.add_argument("--listener-delay-ms", type=float, default=0.0, help="simulated lag of every Firestore listener delivery")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--metrics", choices=["prometheus", "json"], help="print the instrumentation registry instead of the report")
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+    results = [run_game(mode, args.players, args.questions, args.poll_ticks, args.latency_ms / 1000, args.workers, args.timer, args.replicas, args.listener_delay_ms / 1000)
+               for mode in args.modes]
+    if args.metrics: print(REGISTRY.to_prometheus() if args.metrics == "prometheus" else REGISTRY.to_json())
+    elif args.json: print(json.dumps(results, indent=2))
+    else:
+        for result in results: print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Pub/sub, shared cache and leases for running several Quizzicle replicas against one Firestore project.
+
+A coordinator is anything with this small interface:
+
+    publish(channel, message)             deliver a JSON-like message to every subscriber, in order
+    subscribe(channel, callback)          returns a handle with `unsubscribe()`
+    get(key) / set(key, value, ttl=None) / delete(key)
+    acquire(key, owner, ttl)              take or extend a lease; False while someone else holds it
+    release(key, owner)                   give a lease up early, if `owner` still holds it
+
+`LocalCoordinator` keeps everything in process, for a single replica and for tests and load tests that
+run several backends side by side. `RedisCoordinator` shares it all through a Redis server. The game
+hub uses a lease per PIN to pick the one replica that listens to Firestore and runs the game's timer;
+the others follow the diffs it publishes.
+"""
+import copy
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    def __init__(self, unsubscribe):
+        self._unsubscribe = unsubscribe
+
+    def unsubscribe(self):
+        self._unsubscribe()
+
+class LocalCoordinator:
+    """In-process coordinator. Messages are deep-copied and delivered in order on one dispatcher
+    thread, as they would be over the network, so replicas sharing it never share mutable state."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> {token: callback}
+        self._values = {}  # key -> (value, expires_at or None)
+        self._deliveries = queue.Queue()
+        threading.Thread(target=self._dispatch, name="local-coordinator", daemon=True).start()
+
+    def _dispatch(self):
+        while True:
+            callback, message = self._deliveries.get()
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Coordinator subscriber failed")
+
+    def publish(self, channel, message):
+        with self._lock: callbacks = list(self._subscribers.get(channel, {}).values())
+        for callback in callbacks: self._deliveries.put((callback, copy.deepcopy(message)))
+
+    def subscribe(self, channel, callback):
+        token = object()
+        with self._lock: self._subscribers.setdefault(channel, {})[token] = callback
+
+        def unsubscribe():
+            with self._lock:
+                subscribers = self._subscribers.get(channel, {})
+                subscribers.pop(token, None)
+                if not subscribers: self._subscribers.pop(channel, None)
+        return Subscription(unsubscribe)
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]; entry = None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return copy.deepcopy(entry[0]) if entry else None
+
+    def set(self, key, value, ttl=None):
+        now = time.monotonic()
+        with self._lock: self._values[key] = (copy.deepcopy(value), now + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock: self._values.pop(key, None)
+
+    def acquire(self, key, owner, ttl):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None and entry[0] != owner: return False
+            self._values[key] = (owner, now + ttl)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is not None and entry[0] == owner: del self._values[key]
+
+def _encode(value):
+    if isinstance(value, datetime.datetime): return {"$dt": value.isoformat()}
+    raise TypeError(f"Cannot publish {type(value).__name__}")
+
+def _decode(obj):
+    return datetime.datetime.fromisoformat(obj["$dt"]) if obj.keys() == {"$dt"} else obj
+
+class RedisCoordinator:
+    """Coordinator backed by Redis: PUBLISH/SUBSCRIBE for messages, plain keys with expiry for the
+    cache, and SET NX PX plus owner-checked scripts for leases. Messages travel as JSON, with
+    datetimes (Firestore timestamps) tagged so they round-trip; integer map keys become strings."""
+    _ACQUIRE = "local v = redis.call('GET', KEYS[1]) if v == false or v == ARGV[1] then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end return 0"
+    _RELEASE = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, url, prefix="quizzicle:"):
+        import redis  # Optional: only multi-replica deployments need redis.
+        self._redis, self.prefix = redis.Redis.from_url(url), prefix
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> {token: callback}
+        self._acquire, self._release = self._redis.register_script(self._ACQUIRE), self._redis.register_script(self._RELEASE)
+        self._thread = None
+
+    def _dumps(self, value):
+        return json.dumps(value, default=_encode)
+
+    def _loads(self, raw):
+        return json.loads(raw, object_hook=_decode)
+
+    def _on_message(self, raw):
+        channel = raw["channel"].decode()[len(self.prefix):]
+        message = self._loads(raw["data"])
+        with self._lock: callbacks = list(self._subscribers.get(channel, {}).values())
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Coordinator subscriber failed")
+
+    def publish(self, channel, message):
+        self._redis.publish(self.prefix + channel, self._dumps(message))
+
+    def subscribe(self, channel, callback):
+        token = object()
+        with self._lock:
+            first = channel not in self._subscribers
+            self._subscribers.setdefault(channel, {})[token] = callback
+            if first: self._pubsub.subscribe(**{self.prefix + channel: self._on_message})
+            if self._thread is None: self._thread = self._pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+
+        def unsubscribe():
+            with self._lock:
+                subscribers = self._subscribers.get(channel, {})
+                subscribers.pop(token, None)
+                if not subscribers and self._subscribers.pop(channel, None) is not None:
+                    self._pubsub.unsubscribe(self.prefix + channel)
+        return Subscription(unsubscribe)
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return None if raw is None else self._loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(self.prefix + key, self._dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def acquire(self, key, owner, ttl):
+        return bool(self._acquire(keys=[self.prefix + key], args=[self._dumps(owner), int(ttl * 1000)]))
+
+    def release(self, key, owner):
+        self._release(keys=[self.prefix + key], args=[self._dumps(owner)])
@@ -0,0 +1,161 @@
+"""Bulk export of finished games to gzipped NDJSON or Parquet, one row per player per question.
+
+Finished games are paged out of `games` by their `finished_at` time, so memory stays bounded by one
+page (plus one Parquet row group) however many games there are. Each row carries the game (PIN, host,
+mode, timing), the player (final score and rank) and the question (text, answer, the option the
+player picked and whether it was correct). `--archive` then deletes the exported games and frees
+their PINs; only games whose rows made it into a closed output file are removed.
+
+    python export.py games-2024-05-01.ndjson.gz --since 2024-05-01
+    python export.py games.parquet --archive --credentials service-account.json
+"""
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from game_backend import FirestorePool, QuestionBankStore, ShuffledQuestions, delete_game
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+COLUMNS = [  # (name, pyarrow type name)
+    ("pin", "string"), ("host", "string"), ("quiz_mode", "string"), ("created_at", "timestamp"), ("finished_at", "timestamp"),
+    ("time_per_question", "int32"), ("num_questions", "int32"), ("num_players", "int32"), ("bank_id", "string"),
+    ("player", "string"), ("score", "int32"), ("rank", "int32"),
+    ("question_number", "int32"), ("question", "string"), ("answer", "string"),
+    ("answered", "bool"), ("chosen_option", "int32"), ("chosen_answer", "string"), ("correct", "bool"),
+]
+
+def iter_finished_games(db, since=None, page_size=100):
+    """Yields pages of finished game snapshots, oldest `finished_at` first."""
+    query = db.collection("games").where("finished_at", ">=", since or EPOCH).order_by("finished_at").limit(page_size)
+    last = None
+    while True:
+        page = list((query.start_after(last) if last is not None else query).stream())
+        if page: yield page
+        if len(page) < page_size: return
+        last = page[-1]
+
+def game_rows(db, banks, game_doc):
+    """Flattens one finished game into export rows ([] if nobody joined); None if its quiz content is gone."""
+    game, game_ref = game_doc.to_dict(), game_doc.reference
+    content = game_ref.collection("content")
+    quiz = content.document("quiz").get().to_dict() or {}
+    if "bank_id" not in quiz:
+        logger.warning("Skipping game %s: no quiz content", game_doc.id)
+        return None
+    questions = ShuffledQuestions(banks.get(quiz["bank_id"]), quiz["order"])
+    scores = (content.document("results").get().to_dict() or {}).get("scores", {})
+    players = {}
+    for doc in game_ref.collection("players").stream():
+        data = doc.to_dict()
+        players[data.get("name", doc.id)] = data
+    final = {name: scores.get(name, data.get("score", 0)) for name, data in players.items()}
+    rank_of = {}
+    for position, score in enumerate(sorted(final.values(), reverse=True), 1): rank_of.setdefault(score, position)
+    base = {"pin": game_doc.id, "host": game.get("host"), "quiz_mode": game.get("quiz_mode"),
+            "created_at": game.get("created_at"), "finished_at": game.get("finished_at"),
+            "time_per_question": game.get("time_per_question"), "num_questions": len(questions),
+            "num_players": len(players), "bank_id": quiz["bank_id"]}
+    rows = []
+    for name, data in players.items():
+        answers = data.get("answers", {})
+        player = {**base, "player": name, "score": final[name], "rank": rank_of[final[name]]}
+        for q_idx, q in enumerate(questions):
+            chosen = answers.get(str(q_idx))
+            chosen = chosen if isinstance(chosen, int) and 0 <= chosen < len(q.options) else None
+            rows.append({**player, "question_number": q_idx + 1, "question": q.question, "answer": q.answer,
+                         "answered": chosen is not None, "chosen_option": chosen,
+                         "chosen_answer": q.options[chosen] if chosen is not None else None,
+                         "correct": chosen == q.answer_index})
+    return rows
+
+class NdjsonWriter:
+    """Writes rows as newline-delimited JSON, gzip-compressed when the path ends in `.gz`."""
+    def __init__(self, path):
+        self._file = gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") else open(path, "w", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False, default=lambda value: value.isoformat()) + "\n")
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """Writes rows to a Parquet file one row group at a time, so only `row_group_size` rows are held."""
+    def __init__(self, path, compression="zstd", row_group_size=100_000):
+        import pyarrow as pa  # Optional: only Parquet exports need pyarrow.
+        import pyarrow.parquet as pq
+        types = {"string": pa.string(), "int32": pa.int32(), "bool": pa.bool_(), "timestamp": pa.timestamp("us", tz="UTC")}
+        self._pa, self.row_group_size = pa, row_group_size
+        self._schema = pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression)
+        self._pending = []
+
+    def write(self, rows):
+        self._pending.extend(rows)
+        if len(self._pending) >= self.row_group_size: self._flush()
+
+    def _flush(self):
+        if not self._pending: return
+        columns = {name: [row[name] for row in self._pending] for name, _ in COLUMNS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        self._pending = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+def export_games(db, writer, since=None, page_size=100, workers=8):
+    """Streams every finished game since `since` into `writer`. Returns (exported PINs, row count);
+    skipped games are left out of the PINs, so archiving never deletes them."""
+    banks, exported, row_count = QuestionBankStore(db), [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for page in iter_finished_games(db, since, page_size):
+            for game_doc, rows in zip(page, pool.map(lambda doc: game_rows(db, banks, doc), page)):
+                if rows is None: continue  # Not exported, so never archived either.
+                writer.write(rows)
+                exported.append(game_doc.id)
+                row_count += len(rows)
+    return exported, row_count
+
+def load_credentials(path=None):
+    """Service account info from a JSON key file, or FIRESTORE_CREDENTIALS in the app's secrets.toml."""
+    if path:
+        with open(path, encoding="utf-8") as f: return json.load(f)
+    import tomllib
+    with open(".streamlit/secrets.toml", "rb") as f: return tomllib.load(f)["FIRESTORE_CREDENTIALS"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="*.parquet for Parquet; anything else is NDJSON (*.gz to compress)")
+    parser.add_argument("--since", type=datetime.date.fromisoformat, help="only games finished on or after this date (YYYY-MM-DD, UTC)")
+    parser.add_argument("--archive", action="store_true", help="delete exported games from Firestore once the file is written")
+    parser.add_argument("--credentials", help="service account JSON key; defaults to .streamlit/secrets.toml")
+    parser.add_argument("--page-size", type=int, default=100, help="games fetched per query page")
+    parser.add_argument("--workers", type=int, default=8, help="games read concurrently within a page")
+    parser.add_argument("--compression", default="zstd", help="Parquet compression codec")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = FirestorePool(load_credentials(args.credentials), size=max(1, args.workers // 4))
+    since = datetime.datetime.combine(args.since, datetime.time(), datetime.timezone.utc) if args.since else None
+    writer = ParquetWriter(args.output, args.compression) if args.output.endswith(".parquet") else NdjsonWriter(args.output)
+    started = time.perf_counter()
+    try:
+        exported, row_count = export_games(db, writer, since, args.page_size, args.workers)
+    finally:
+        writer.close()
+    logger.info("Exported %d games (%d rows) to %s in %.1fs", len(exported), row_count, args.output, time.perf_counter() - started)
+    if args.archive:
+        for game_pin in exported: delete_game(db, game_pin)
+        logger.info("Archived %d games out of the games collection", len(exported))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1111 @@
+"""Quizzicle's game logic and storage layout, independent of the Streamlit UI.
+
+Everything here talks to a Firestore-compatible client: a real `FirestorePool` in production or
+`memory_firestore.MemoryClient` for local runs and load tests. `QuizBackend` bundles the
+process-wide pieces (state hub, write buffer, question banks, scoring engines) and exposes the
+game operations the screens call. Every Firestore call is timed, and the documents it reads and
+writes are counted per game PIN, in `metrics.REGISTRY`. Several replicas can serve the same games
+by sharing a `coordination` coordinator: one replica per game listens to Firestore and fans out diffs.
+
+Storage layout:
+    banks/{bank_id}                        compiled question bank header
+    banks/{bank_id}/chunks/{n}             questions, in chunks
+    games/{pin}                            hot state: status, question index, timer, version
+    games/{pin}/content/quiz               bank id and shuffled question order
+    games/{pin}/content/results            published scores and per-question stats
+    games/{pin}/players/{player_doc_id}    name, score and answers (as option indices)
+    games/{pin}/tallies/{q}-{shard}        answers per option for question q, sharded by player
+    pins/{pin}                             index of live games; PIN reservation with expiry
+"""
+import atexit
+import bisect
+import datetime
+import hashlib
+import heapq
+import io
+import itertools
+import logging
+import queue
+import random
+import string
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from functools import partial, wraps
+
+import numpy as np
+from google.api_core.exceptions import AlreadyExists, DeadlineExceeded, ServiceUnavailable
+from google.cloud import firestore
+
+from coordination import LocalCoordinator
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+OPTION_MARKERS = ['🟥', '🔷', '🟡', '💚']
+
+Question = namedtuple("Question", ["question", "options", "answer", "answer_index"])
+
+def timed(op, game_pin=""):
+    """Times one Firestore round trip; yields its labels, so a PIN learned mid-call can still be added."""
+    return REGISTRY.timer("quizzicle_firestore_seconds", op=op, pin=game_pin)
+
+def count_io(op, game_pin="", reads=0, writes=0):
+    if reads: REGISTRY.inc("quizzicle_firestore_reads_total", reads, op=op, pin=game_pin)
+    if writes: REGISTRY.inc("quizzicle_firestore_writes_total", writes, op=op, pin=game_pin)
+
+def transactional(func):
+    """`firestore.transactional`, also accepting transactions that retry themselves through `run`
+    (the in-memory client's), so the backend works against either without importing the stand-in."""
+    real = firestore.transactional(func)
+    @wraps(func)
+    def run(transaction, *args, **kwargs):
+        if isinstance(transaction, firestore.Transaction): return real(transaction, *args, **kwargs)
+        return transaction.run(func, *args, **kwargs)
+    return run
+
+class QuizParseError(ValueError):
+    """Raised with every problem found in an uploaded quiz, each tagged with its line number."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(f"Line {line_no}: {message}" for line_no, message in errors))
+
+def iter_quiz_questions(lines, errors):
+    """Streams `Question`s out of Q:/O:/A: blocks, appending (line_no, message) to `errors` for bad ones."""
+    block, start = None, 0
+
+    def finish():
+        if block is None: return None
+        problems = [f"missing {k}" for k, v in (("Q:", block["question"]), ("O:", block["options"]), ("A:", block["answer"])) if not v]
+        if not problems and block["answer"] not in block["options"]: problems.append(f"answer '{block['answer']}' is not one of the options")
+        if not problems and not 2 <= len(block["options"]) <= len(OPTION_MARKERS):
+            problems.append(f"needs 2 to {len(OPTION_MARKERS)} options, found {len(block['options'])}")
+        if problems:
+            errors.append((start, "question block " + ", ".join(problems)))
+            return None
+        return Question(block["question"], tuple(block["options"]), block["answer"], block["options"].index(block["answer"]))
+
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            question, block = finish(), None
+            if question: yield question
+        elif line.startswith("Q:"):
+            question = finish()
+            if question: yield question
+            block, start = {"question": line[2:].strip(), "options": [], "answer": None}, line_no
+        elif block is None:
+            errors.append((line_no, "expected a line starting with Q:"))
+        elif line.startswith("O:"): block["options"].append(line[2:].strip())
+        elif line.startswith("A:"):
+            if block["answer"] is not None: errors.append((line_no, "question has more than one A: line"))
+            block["answer"] = line[2:].strip()
+        else:
+            errors.append((line_no, "expected a line starting with O: or A:"))
+    question = finish()
+    if question: yield question
+
+def parse_text_quiz(stream):
+    """Parses a binary quiz upload line by line; raises `QuizParseError` listing every malformed line."""
+    errors, text = [], io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    try:
+        questions = tuple(iter_quiz_questions(text, errors))
+    finally:
+        text.detach()  # Leave the caller's stream open.
+    if errors: raise QuizParseError(sorted(errors))
+    if not questions: raise QuizParseError([(1, "file contains no questions")])
+    return questions
+
+def hash_stream(stream, chunk_size=1 << 16):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""): digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()[:32]
+
+class ShuffledQuestions:
+    """A game's view of a shared bank through an index permutation, so no game copies the questions."""
+    def __init__(self, questions, order):
+        self._questions, self._order = questions, order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, i):
+        return self._questions[self._order[i]]
+
+    def __iter__(self):
+        return (self._questions[i] for i in self._order)
+
+class QuestionBankStore:
+    """Compiled question banks keyed by content hash: in memory per process, persisted once in Firestore.
+
+    A bank is written to `banks/{bank_id}` with its questions split across `chunks` documents so even
+    banks of thousands of questions stay under the per-document size limit.
+    """
+    def __init__(self, db, max_banks=64, chunk_size=500):
+        self.db, self.max_banks, self.chunk_size = db, max_banks, chunk_size
+        self._lock = threading.Lock()
+        self._banks = OrderedDict()
+
+    def _remember(self, bank_id, questions):
+        with self._lock:
+            self._banks[bank_id] = questions
+            self._banks.move_to_end(bank_id)
+            while len(self._banks) > self.max_banks: self._banks.popitem(last=False)
+        return questions
+
+    def _cached(self, bank_id):
+        with self._lock:
+            questions = self._banks.get(bank_id)
+            if questions is not None: self._banks.move_to_end(bank_id)
+            return questions
+
+    def get(self, bank_id):
+        questions = self._cached(bank_id)
+        if questions is not None: return questions
+        bank = self.db.collection("banks").document(bank_id)
+        with timed("banks.load"): chunks = sorted(bank.collection("chunks").stream(), key=lambda doc: int(doc.id))
+        count_io("banks.load", reads=len(chunks))
+        questions = tuple(Question(q["q"], tuple(q["o"]), q["o"][q["a"]], q["a"])
+                          for doc in chunks for q in doc.to_dict()["questions"])
+        return self._remember(bank_id, questions)
+
+    def compile_upload(self, stream):
+        """Returns (bank_id, questions) for an upload, parsing and saving it only if its hash is new."""
+        bank_id = hash_stream(stream)
+        questions = self._cached(bank_id)
+        if questions is not None: return bank_id, questions
+        bank = self.db.collection("banks").document(bank_id)
+        with timed("banks.exists"): exists = bank.get().exists
+        count_io("banks.exists", reads=1)
+        if exists: return bank_id, self.get(bank_id)
+        questions = parse_text_quiz(stream)
+        for start in range(0, len(questions), self.chunk_size * 10):
+            batch = self.db.batch()
+            chunk_starts = range(start, min(start + self.chunk_size * 10, len(questions)), self.chunk_size)
+            for chunk_start in chunk_starts:
+                chunk = questions[chunk_start:chunk_start + self.chunk_size]
+                batch.set(bank.collection("chunks").document(str(chunk_start // self.chunk_size)),
+                          {"questions": [{"q": q.question, "o": list(q.options), "a": q.answer_index} for q in chunk]})
+            with timed("banks.save"): batch.commit()
+            count_io("banks.save", writes=len(chunk_starts))
+        # The parent document is written last, so its existence means every chunk is in place.
+        with timed("banks.save"): bank.set({"num_questions": len(questions), "chunk_size": self.chunk_size, "created_at": firestore.SERVER_TIMESTAMP})
+        count_io("banks.save", writes=1)
+        return bank_id, self._remember(bank_id, questions)
+
+def player_doc_id(player_name):
+    """Names may contain characters Firestore rejects in document IDs, so player docs are keyed by a hash."""
+    return hashlib.sha1(player_name.encode("utf-8")).hexdigest()[:20]
+
+class Leaderboard:
+    """Players ranked by score, kept sorted with bisect as individual scores change.
+
+    Updating one player costs O(log n) to locate plus a list shift, so the hub can maintain
+    it from listener changes and every render only reads the top K and one player's rank.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []  # sorted (-score, name)
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def update(self, name, score):
+        with self._lock:
+            self._discard(name)
+            self._scores[name] = score
+            bisect.insort(self._entries, (-score, name))
+
+    def remove(self, name):
+        with self._lock: self._discard(name)
+
+    def _discard(self, name):
+        if name in self._scores:
+            del self._entries[bisect.bisect_left(self._entries, (-self._scores.pop(name), name))]
+
+    def top(self, k):
+        with self._lock: return [(name, -neg_score) for neg_score, name in self._entries[:k]]
+
+    def rank(self, name):
+        """Returns the player's 0-based position and score, or (None, 0) if they are not on the board."""
+        with self._lock:
+            if name not in self._scores: return None, 0
+            score = self._scores[name]
+            return bisect.bisect_left(self._entries, (-score, name)), score
+
+class GameStateHub:
+    """Keeps one Firestore listener per active game PIN, shared by every session in this process.
+
+    Each game is watched through its small hot document plus its `players` and `tallies`
+    subcollections; the quiz content never changes after creation and is cached separately by
+    `get_quiz_questions`. Tally shards are summed here as they change, so `answer_counts` (question
+    index -> {option index: answers}) costs nothing to read.
+
+    With several replicas sharing a `coordinator`, only the replica holding a game's lease opens
+    those listeners (and schedules its timer). It publishes every change as a diff on `game:{pin}`;
+    the other replicas apply the diffs instead, asking on `game:{pin}:sync` for a full snapshot when
+    they start following or miss a message, and take the lease over when the owner hands it off or
+    stops renewing it. Firestore reads then grow with the number of games, not of replicas.
+
+    Calls to the coordinator never run under the hub's lock: messages are queued per game and sent
+    in order from a small pool, so a slow or failing coordinator delays the followers (which resync
+    on the resulting gap) but never the sessions. `on_flush` is called when another replica watching
+    a game asks, through `request_flush`, for buffered answers to be committed.
+    """
+    def __init__(self, db, idle_ttl=30, ready_timeout=5, on_state=None, coordinator=None, lease_ttl=15, on_flush=None):
+        self.db, self.idle_ttl, self.ready_timeout, self.on_state, self.on_flush = db, idle_ttl, ready_timeout, on_state, on_flush
+        self.coordinator, self.lease_ttl = coordinator or LocalCoordinator(), lease_ttl
+        self.replica_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._games = {}  # pin -> {"state", "read_time", "players", "leaderboard", "results", "tallies", "answer_counts", "ready", "players_ready",
+                          #         "owner", "source", "seq", "sync_requested", "sync_pending", "watches", "sessions"}
+        self._outbox = {}  # pin -> deque of coordinator calls still to make, drained by one sender at a time
+        self._to_drain = queue.Queue()  # pins whose outbox has just been started
+        for _ in range(4): threading.Thread(target=self._send_loop, name="game-fanout", daemon=True).start()
+        self._wake_keeper = threading.Event()
+        threading.Thread(target=self._keep_leases, name="game-leases", daemon=True).start()
+
+    def _set_state(self, game, state, read_time):
+        applied = game["read_time"] is None or read_time is None or read_time >= game["read_time"]
+        if applied: game["state"], game["read_time"] = state, read_time
+        game["ready"].set()
+        return applied
+
+    def _apply(self, game_pin, state, read_time):
+        with self._lock: game = self._games.get(game_pin)
+        if game is None: return
+        if game["owner"] and state and state.get("status") == "finished" and game["results"] is None:
+            # Publish the results ahead of the status change, so followers never have to fetch them.
+            self._load_results(game_pin, game)
+        with self._lock:
+            applied, owner = self._set_state(game, state, read_time), game["owner"]
+            # A direct read can be newer than the listener's next delivery, which is then skipped.
+            if applied: self._publish(game_pin, game, "state", state=state, read_time=read_time)
+            self._answer_sync(game_pin, game)
+        if applied and owner and self.on_state: self.on_state(game_pin, state)
+
+    def peek_state(self, game_pin):
+        """Returns the listener's hot state if this process is watching the game, else None."""
+        with self._lock:
+            game = self._games.get(game_pin)
+            return game["state"] if game and game["ready"].is_set() else None
+
+    def is_follower(self, game_pin):
+        """True while another replica owns this game's listeners and timer."""
+        with self._lock:
+            game = self._games.get(game_pin)
+            return game is not None and not game["owner"]
+
+    # Diffs are lists of [key, value or None], so they survive a JSON round trip unchanged.
+    def _apply_players(self, game, diffs):
+        players, leaderboard, scores = dict(game["players"]), game["leaderboard"], (game["results"] or {}).get("scores", {})
+        for name, data in diffs:
+            if data is None:
+                players.pop(name, None); leaderboard.remove(name); continue
+            if name in scores: data = {**data, "score": scores[name]}
+            previous = players.get(name)
+            players[name] = data
+            if previous is None or previous.get("score", 0) != data.get("score", 0):
+                leaderboard.update(name, data.get("score", 0))
+        game["players"] = players
+        game["players_version"] += 1
+        game["players_ready"].set()
+
+    def _apply_tallies(self, game, diffs):
+        tallies, answer_counts, touched = game["tallies"], dict(game["answer_counts"]), set()
+        for doc_id, fields in diffs:
+            q_idx = int(doc_id.split("-")[0])
+            shards = tallies.setdefault(q_idx, {})
+            if fields is None: shards.pop(doc_id, None)
+            else: shards[doc_id] = {int(k[1:]): v for k, v in fields.items() if k.startswith("o")}
+            touched.add(q_idx)
+        for q_idx in touched:
+            totals = Counter()
+            for shard in tallies[q_idx].values(): totals.update(shard)
+            answer_counts[q_idx] = dict(totals)
+        game["answer_counts"] = answer_counts
+        game["answers_version"] += 1
+
+    def _apply_results(self, game, results):
+        scores = results.get("scores", {})
+        game["results"] = results
+        game["players"] = {name: {**data, "score": scores.get(name, data.get("score", 0))} for name, data in game["players"].items()}
+        for name, score in scores.items(): game["leaderboard"].update(name, score)
+
+    def _send(self, game_pin, call, *args):
+        """Queues a coordinator call for the game. Lock held; the calls run later, in order, off the lock."""
+        pending = self._outbox.get(game_pin)
+        if pending is None:
+            pending = self._outbox[game_pin] = deque()
+            self._to_drain.put(game_pin)
+        pending.append(partial(call, *args))
+
+    def _send_loop(self):
+        while True: self._drain(self._to_drain.get())
+
+    def _drain(self, game_pin):
+        while True:
+            with self._lock:
+                pending = self._outbox[game_pin]
+                if not pending:
+                    del self._outbox[game_pin]; return
+                call = pending.popleft()
+            try:
+                call()
+            except Exception:
+                logger.exception("Coordinator call for game %s failed", game_pin)
+
+    def _publish(self, game_pin, game, kind, **fields):
+        """Fans a change out to the followers; called with the lock held, so messages keep apply order."""
+        if not game["owner"]: return
+        game["seq"] += 1
+        self._send(game_pin, self.coordinator.publish, f"game:{game_pin}", {"kind": kind, "owner": self.replica_id, "seq": game["seq"], **fields})
+        REGISTRY.inc("quizzicle_fanout_messages_total", kind=kind)
+
+    def _on_snapshot(self, game_pin, doc_snapshots, changes, read_time):
+        state = doc_snapshots[0].to_dict() if doc_snapshots else None
+        count_io("listener.game", game_pin, reads=1)
+        self._apply(game_pin, state, read_time)
+
+    def _on_players_snapshot(self, game_pin, doc_snapshots, changes, read_time):
+        count_io("listener.players", game_pin, reads=max(1, len(changes)))
+        diffs = []
+        for change in changes:
+            data = change.document.to_dict() or {}
+            name = data.pop("name", change.document.id)
+            diffs.append([name, None if change.type.name == "REMOVED" else data])
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None: return
+            self._apply_players(game, diffs)
+            self._publish(game_pin, game, "players", diffs=diffs)
+            self._answer_sync(game_pin, game)
+
+    def _on_tallies_snapshot(self, game_pin, doc_snapshots, changes, read_time):
+        count_io("listener.tallies", game_pin, reads=max(1, len(changes)))
+        diffs = [[change.document.id, None if change.type.name == "REMOVED" else change.document.to_dict() or {}] for change in changes]
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None: return
+            self._apply_tallies(game, diffs)
+            self._publish(game_pin, game, "tallies", diffs=diffs)
+
+    def _on_sync_request(self, game_pin, message):
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None or not game["owner"]: return
+            game["sync_pending"] = True
+            self._answer_sync(game_pin, game)
+
+    def _answer_sync(self, game_pin, game):
+        """Sends the snapshot followers asked for, once the listeners have delivered both state and players. Lock held."""
+        if not (game["owner"] and game["sync_pending"] and game["ready"].is_set() and game["players_ready"].is_set()): return
+        game["sync_pending"] = False
+        tallies = [[doc_id, {f"o{i}": n for i, n in shard.items()}] for shards in game["tallies"].values() for doc_id, shard in shards.items()]
+        self._publish(game_pin, game, "snapshot", state=game["state"], read_time=game["read_time"], results=game["results"],
+                      players=[[name, data] for name, data in game["players"].items()], tallies=tallies,
+                      players_ready=game["players_ready"].is_set())
+
+    def _request_sync(self, game_pin, game):
+        now = time.monotonic()
+        if now - game["sync_requested"] < 1: return
+        game["sync_requested"] = now
+        self._send(game_pin, self.coordinator.publish, f"game:{game_pin}:sync", {"replica": self.replica_id})
+
+    def _resync_if_unready(self, game_pin):
+        """Asks the owner again while a followed game still lacks its state or players (rate-limited)."""
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is not None and not game["owner"] and not (game["ready"].is_set() and game["players_ready"].is_set()):
+                self._request_sync(game_pin, game)
+
+    def request_flush(self, game_pin):
+        """Asks the other replicas watching the game to commit their buffered writes now."""
+        with self._lock: self._send(game_pin, self.coordinator.publish, f"game:{game_pin}:flush", {"replica": self.replica_id})
+
+    def _on_flush_request(self, game_pin, message):
+        if message["replica"] != self.replica_id and self.on_flush: self.on_flush()
+
+    def _on_message(self, game_pin, message):
+        """Applies a diff from the game's owner, or resynchronises when one was missed."""
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None or game["owner"]: return
+            kind = message["kind"]
+            REGISTRY.inc("quizzicle_fanout_received_total", kind=kind)
+            if kind == "handoff":
+                self._wake_keeper.set(); return
+            if kind == "snapshot":
+                game["players"], game["leaderboard"], game["tallies"], game["results"] = {}, Leaderboard(), {}, None
+                self._apply_players(game, message["players"])
+                if not message["players_ready"]: game["players_ready"].clear()
+                self._apply_tallies(game, message["tallies"])
+                if message["results"]: self._apply_results(game, message["results"])
+                game["read_time"] = None
+                self._set_state(game, message["state"], message["read_time"])
+            elif message["owner"] != game["source"] or message["seq"] != game["seq"] + 1:
+                self._request_sync(game_pin, game); return
+            elif kind == "state": self._set_state(game, message["state"], message["read_time"])
+            elif kind == "players": self._apply_players(game, message["diffs"])
+            elif kind == "tallies": self._apply_tallies(game, message["diffs"])
+            elif kind == "results": self._apply_results(game, message["results"])
+            game["source"], game["seq"] = message["owner"], message["seq"]
+
+    def _open(self, game_pin, game):
+        """Starts listening to Firestore if this replica owns the game, else following its owner. Lock held."""
+        flushes = self.coordinator.subscribe(f"game:{game_pin}:flush", partial(self._on_flush_request, game_pin))
+        if game["owner"]:
+            doc = self.db.collection("games").document(game_pin)
+            return [doc.on_snapshot(partial(self._on_snapshot, game_pin)),
+                    doc.collection("players").on_snapshot(partial(self._on_players_snapshot, game_pin)),
+                    doc.collection("tallies").on_snapshot(partial(self._on_tallies_snapshot, game_pin)),
+                    self.coordinator.subscribe(f"game:{game_pin}:sync", partial(self._on_sync_request, game_pin)), flushes]
+        game["source"], game["seq"], game["sync_requested"] = None, 0, 0.0
+        subscription = self.coordinator.subscribe(f"game:{game_pin}", partial(self._on_message, game_pin))
+        self._request_sync(game_pin, game)
+        return [subscription, flushes]
+
+    def _close(self, closed):
+        """Stops the watches of games nobody here looks at anymore, handing owned games to a follower."""
+        for game_pin, game in closed:
+            for watch in game["watches"]: watch.unsubscribe()
+            if game["owner"]:
+                with self._lock:
+                    self._send(game_pin, self.coordinator.release, f"lease:game:{game_pin}", self.replica_id)
+                    self._send(game_pin, self.coordinator.publish, f"game:{game_pin}", {"kind": "handoff", "owner": self.replica_id})
+
+    def _keep_leases(self):
+        """Drops idle sessions, renews the leases of owned games and takes over followed games whose owner has gone."""
+        while True:
+            self._wake_keeper.wait(min(self.lease_ttl / 3, self.idle_ttl / 2))
+            self._wake_keeper.clear()
+            with self._lock: stale = self._evict_idle()
+            self._close(stale)
+            with self._lock: pins = list(self._games)
+            for game_pin in pins:
+                try:
+                    owner = self.coordinator.acquire(f"lease:game:{game_pin}", self.replica_id, self.lease_ttl)
+                    self._switch(game_pin, owner)
+                    self._resync_if_unready(game_pin)
+                except Exception:
+                    logger.exception("Renewing the lease on game %s failed", game_pin)
+
+    def _switch(self, game_pin, owner):
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None or game["owner"] == owner:
+                if game is None and owner: self._send(game_pin, self.coordinator.release, f"lease:game:{game_pin}", self.replica_id)
+                return
+            logger.info("Replica %s %s game %s", self.replica_id[:8], "takes over" if owner else "lost", game_pin)
+            old, game["owner"] = game["watches"], owner
+            game["watches"] = self._open(game_pin, game)
+        for watch in old: watch.unsubscribe()
+
+    def _evict_idle(self):
+        """Drops sessions that stopped polling and returns the games nobody watches anymore."""
+        now, stale = time.monotonic(), []
+        for game_pin, game in list(self._games.items()):
+            game["sessions"] = {sid: seen for sid, seen in game["sessions"].items() if now - seen < self.idle_ttl}
+            if not game["sessions"]:
+                stale.append((game_pin, self._games.pop(game_pin)))
+        return stale
+
+    def _acquire(self, game_pin):
+        try:
+            return self.coordinator.acquire(f"lease:game:{game_pin}", self.replica_id, self.lease_ttl)
+        except Exception:
+            # Listen to Firestore directly meanwhile; the lease keeper settles ownership once the coordinator answers.
+            logger.exception("Taking the lease on game %s failed", game_pin)
+            return True
+
+    def watch(self, game_pin, session_id):
+        """Registers the session's poll; sessions that stop polling are dropped by the lease keeper."""
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is not None: game["sessions"][session_id] = time.monotonic()
+        if game is not None: return game
+        owner = self._acquire(game_pin)
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None:
+                game = self._games[game_pin] = {"state": None, "read_time": None, "players": {}, "players_version": 0, "leaderboard": Leaderboard(), "results": None,
+                                                "tallies": {}, "answer_counts": {}, "answers_version": 0, "ready": threading.Event(),
+                                                "players_ready": threading.Event(), "source": None, "seq": 0, "sync_requested": 0.0, "sync_pending": False, "watches": [], "sessions": {},
+                                                "owner": owner}
+                game["watches"] = self._open(game_pin, game)
+            game["sessions"][session_id] = time.monotonic()
+        return game
+
+    def release(self, game_pin, session_id):
+        with self._lock:
+            game = self._games.get(game_pin)
+            if game is None: return
+            game["sessions"].pop(session_id, None)
+            closed = [(game_pin, self._games.pop(game_pin))] if not game["sessions"] else []
+        self._close(closed)
+
+    def _wait(self, game_pin, event):
+        """Waits up to `ready_timeout` for `event`, asking the owner for a snapshot again each second meanwhile."""
+        deadline = time.monotonic() + self.ready_timeout
+        while not event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return False
+            self._resync_if_unready(game_pin)
+            event.wait(min(1, remaining))
+        return True
+
+    def get(self, game_pin, session_id):
+        game = self.watch(game_pin, session_id)
+        if not self._wait(game_pin, game["ready"]):
+            state = self.refresh(game_pin)
+        else:
+            state = game["state"]
+        if state is None: return None
+        self._wait(game_pin, game["players_ready"])
+        if state.get("status") == "finished" and game["results"] is None:
+            self._load_results(game_pin, game)
+        return {**state, "players": game["players"], "players_version": game["players_version"],
+                "leaderboard": game["leaderboard"], "results": game["results"],
+                "answer_counts": game["answer_counts"], "answers_version": game["answers_version"]}
+
+    def _load_results(self, game_pin, game):
+        """Fetches the published results once and folds timed-mode scores into the players and leaderboard."""
+        with timed("results.get", game_pin):
+            results = self.db.collection("games").document(game_pin).collection("content").document("results").get().to_dict()
+        count_io("results.get", game_pin, reads=1)
+        if results is None: return
+        with self._lock:
+            self._apply_results(game, results)
+            self._publish(game_pin, game, "results", results=results)
+
+    def refresh(self, game_pin):
+        """Reads the hot document directly, so a session sees its own writes before the listener catches up."""
+        with timed("game.get", game_pin): snapshot = self.db.collection("games").document(game_pin).get()
+        count_io("game.get", game_pin, reads=1)
+        state = snapshot.to_dict()
+        self._apply(game_pin, state, snapshot.read_time)
+        return state
+
+class PlayerWriteBuffer:
+    """Coalesces player document updates and commits them as batched writes on a short interval.
+
+    Answers land on each player's own document, so players never contend with each other; the
+    buffer additionally folds repeated updates to the same document (and stacked `Increment`s)
+    into one write, so a burst of submissions costs a handful of batch commits. `upsert` writes
+    merge into a document that may not exist yet, as the answer tally shards do.
+    """
+    def __init__(self, db, interval=0.25, max_batch=450):
+        self.db, self.interval, self.max_batch = db, interval, max_batch
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # document path -> (ref, fields, upsert)
+        self._wake, self._now = threading.Event(), threading.Event()
+        threading.Thread(target=self._run, name="player-write-buffer", daemon=True).start()
+        atexit.register(self.flush)
+
+    def submit(self, ref, fields, upsert=False):
+        with self._lock:
+            _, pending, _ = self._pending.setdefault(ref.path, (ref, {}, upsert))
+            for key, value in fields.items():
+                previous = pending.get(key)
+                if isinstance(value, firestore.Increment) and isinstance(previous, firestore.Increment):
+                    value = firestore.Increment(previous.value + value.value)
+                pending[key] = value
+        self._wake.set()
+
+    def flush_soon(self):
+        """Has the flusher thread commit what is pending without waiting out its interval."""
+        self._now.set(); self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._now.wait(self.interval)
+            self._wake.clear(); self._now.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered player writes failed")
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = list(self._pending.values()), {}
+            for start in range(0, len(pending), self.max_batch):
+                chunk = pending[start:start + self.max_batch]
+                batch = self.db.batch()
+                for ref, fields, upsert in chunk:
+                    if upsert: batch.set(ref, fields, merge=True)
+                    else: batch.update(ref, fields)
+                try:
+                    with timed("answers.flush"): batch.commit()
+                    for (game_pin, kind), writes in Counter(tuple(ref.path.split("/")[1:3]) for ref, _, _ in chunk).items():
+                        count_io(f"{kind}.flush", game_pin, writes=writes)
+                except Exception:
+                    # One missing document fails the whole batch, so retry the rest individually.
+                    for ref, fields, upsert in chunk:
+                        try:
+                            if upsert: ref.set(fields, merge=True)
+                            else: ref.update(fields)
+                        except Exception: logger.exception("Dropping buffered write to %s", ref.path)
+
+class ScoringEngine:
+    """Scores a game question by question from a compact players × questions matrix of option indices.
+
+    Each question is scored once, when it closes, with a vectorized compare against the answer
+    key; the same pass records how many players picked each option. Finishing the game then
+    only has to score the last question and publish the running totals.
+    """
+    def __init__(self, questions):
+        self.answer_key = np.array([q.answer_index for q in questions], dtype=np.int16)
+        self.option_counts = [len(q.options) for q in questions]
+        self.names, self._rows = [], {}
+        self.answers = np.full((0, len(questions)), -1, dtype=np.int8)
+        self.totals = np.zeros(0, dtype=np.int32)
+        self.closed = np.zeros(len(questions), dtype=bool)
+        self.question_stats = [None] * len(questions)
+        self._lock = threading.Lock()
+
+    def _add_players(self, names):
+        new = [name for name in names if name not in self._rows]
+        if not new: return
+        for name in new:
+            self._rows[name] = len(self.names); self.names.append(name)
+        self.answers = np.vstack([self.answers, np.full((len(new), self.answers.shape[1]), -1, dtype=np.int8)])
+        self.totals = np.concatenate([self.totals, np.zeros(len(new), dtype=np.int32)])
+
+    def close_question(self, q_idx, answers):
+        """Fills column `q_idx` from {player: option index} and scores it; closing twice is a no-op."""
+        with self._lock:
+            if self.closed[q_idx]: return
+            self._add_players(answers)
+            column = self.answers[:, q_idx]
+            for name, answer in answers.items():
+                if isinstance(answer, int) and 0 <= answer < self.option_counts[q_idx]:
+                    column[self._rows[name]] = answer
+            correct = column == self.answer_key[q_idx]
+            self.totals += correct
+            answered = column >= 0
+            self.question_stats[q_idx] = {
+                "answered": int(answered.sum()), "correct": int(correct.sum()),
+                "options": np.bincount(column[answered], minlength=self.option_counts[q_idx]).tolist(),
+            }
+            self.closed[q_idx] = True
+
+    def close_through(self, q_idx, load_answers):
+        """Closes every question up to `q_idx` this engine has not seen close, reading each one's answers
+        through `load_answers(i)`; a process that missed a question (another replica advanced it) catches up."""
+        for i in np.flatnonzero(~self.closed[:q_idx + 1]):
+            self.close_question(int(i), load_answers(int(i)))
+
+    def scores(self):
+        with self._lock: return dict(zip(self.names, self.totals.tolist()))
+
+class AdmissionRejected(Exception):
+    """The join queue is full, or a join waited too long for its turn."""
+
+class AdmissionGate:
+    """Bounds concurrent registrations and the queue behind them, so a join storm degrades into
+    a short wait (or a polite "try again") instead of piling up timed-out Firestore calls."""
+    def __init__(self, max_concurrent=32, max_waiting=512, timeout=15):
+        self.max_waiting, self.timeout = max_waiting, timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            if self.waiting >= self.max_waiting: raise AdmissionRejected()
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock: self.waiting -= 1
+        if not acquired: raise AdmissionRejected()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+class PinAllocator:
+    """Hands out game PINs that are guaranteed unused, and frees them again after a TTL.
+
+    `pins/{pin}` is the index of live games: a PIN is reserved by creating its document in the same
+    batch that creates the game (the game documents are created too, so a PIN whose reservation is
+    gone but whose game is not is never reused). Each entry carries an `expires_at`, reset when the
+    game finishes so the results outlive a nightly export; `GameSweeper` removes expired entries
+    together with their games.
+    """
+    ALPHABET = string.ascii_uppercase + string.digits
+
+    def __init__(self, db, length=4, active_ttl=datetime.timedelta(hours=12), finished_ttl=datetime.timedelta(hours=36), max_attempts=20):
+        self.db, self.length, self.active_ttl, self.finished_ttl, self.max_attempts = db, length, active_ttl, finished_ttl, max_attempts
+
+    def pin_ref(self, game_pin):
+        return self.db.collection("pins").document(game_pin)
+
+    def random_pin(self):
+        return ''.join(random.choices(self.ALPHABET, k=self.length))
+
+    def entry(self, status, ttl):
+        return {"status": status, "updated_at": firestore.SERVER_TIMESTAMP,
+                "expires_at": datetime.datetime.now(datetime.timezone.utc) + ttl}
+
+    def reserve(self, write_game):
+        """Calls `write_game(batch, pin)` for fresh PINs until the batch, with the reservation, commits."""
+        for _ in range(self.max_attempts):
+            game_pin, batch = self.random_pin(), self.db.batch()
+            batch.create(self.pin_ref(game_pin), self.entry("active", self.active_ttl))
+            write_game(batch, game_pin)
+            try:
+                with timed("games.create", game_pin): batch.commit()
+                count_io("games.create", game_pin, writes=3)
+                return game_pin
+            except AlreadyExists:
+                REGISTRY.inc("quizzicle_pin_collisions_total")
+                continue
+        raise RuntimeError("Could not find a free game PIN; too many games are active.")
+
+    def mark_finished(self, transaction, game_pin):
+        transaction.set(self.pin_ref(game_pin), self.entry("finished", self.finished_ttl), merge=True)
+
+class GameSweeper:
+    """Background thread that deletes games whose PIN reservation has expired, in batched writes.
+
+    With a shared `coordinator`, only the replica holding the sweeper lease sweeps each round.
+    """
+    def __init__(self, db, pins, interval=600, page_size=50, max_batch=450, coordinator=None, owner=None):
+        self.db, self.pins, self.interval, self.page_size, self.max_batch = db, pins, interval, page_size, max_batch
+        self.coordinator, self.owner = coordinator, owner
+        threading.Thread(target=self._run, name="game-sweeper", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.coordinator and not self.coordinator.acquire("lease:sweeper", self.owner, self.interval * 1.5): continue
+                self.sweep()
+            except Exception:
+                logger.exception("Sweeping expired games failed")
+
+    def sweep(self, now=None):
+        """Deletes every expired game and frees its PIN, then any game older than both expiry periods,
+        which can only be one whose reservation is missing. Returns the number of games removed."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        orphaned_before = now - self.pins.active_ttl - self.pins.finished_ttl
+        return (self._sweep("pins.expired", self.db.collection("pins").where("expires_at", "<=", now))
+                + self._sweep("games.orphaned", self.db.collection("games").where("created_at", "<=", orphaned_before)))
+
+    def _sweep(self, op, query):
+        removed = 0
+        while True:
+            with timed(op): expired = list(query.limit(self.page_size).stream())
+            count_io(op, reads=max(1, len(expired)))
+            for doc in expired: delete_game(self.db, doc.id, self.max_batch)
+            removed += len(expired)
+            if len(expired) < self.page_size: return removed
+
+def delete_game(db, game_pin, max_batch=450):
+    """Deletes a game document and every document in its subcollections, in batches, and frees its PIN."""
+    game_ref = db.collection("games").document(game_pin)
+    batch = db.batch()
+    pending = deleted = 0
+    with timed("games.delete", game_pin):
+        for collection in game_ref.collections():
+            for doc in collection.stream():
+                batch.delete(doc.reference); pending += 1; deleted += 1
+                if pending >= max_batch:
+                    batch.commit(); batch, pending = db.batch(), 0
+        batch.delete(game_ref)
+        batch.delete(db.collection("pins").document(game_pin))
+        batch.commit()
+    count_io("games.delete", game_pin, reads=deleted, writes=deleted + 2)
+    REGISTRY.forget(pin=game_pin)
+
+class GameScheduler:
+    """Owns the question deadlines of every timed game this process knows about.
+
+    One thread sleeps on a heap of (deadline, pin, question index) and, when a deadline passes,
+    asks the backend to advance that game. The advance is a conditional transaction, so however
+    many processes or host tabs schedule the same deadline, the transition happens once.
+    """
+    def __init__(self, on_deadline, retry_delay=1.0):
+        self.on_deadline, self.retry_delay = on_deadline, retry_delay
+        self._cond = threading.Condition()
+        self._heap = []
+        self._due = {}  # pin -> (q_idx, deadline) currently owed
+        threading.Thread(target=self._run, name="game-scheduler", daemon=True).start()
+
+    def schedule(self, game_pin, q_idx, deadline):
+        with self._cond:
+            due = self._due.get(game_pin)
+            if due is not None and (due[0] > q_idx or due == (q_idx, deadline)): return
+            self._due[game_pin] = (q_idx, deadline)
+            heapq.heappush(self._heap, (deadline, game_pin, q_idx))
+            self._cond.notify()
+
+    def cancel(self, game_pin):
+        with self._cond: self._due.pop(game_pin, None)
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait(); continue
+                deadline, game_pin, q_idx = self._heap[0]
+                if self._due.get(game_pin) != (q_idx, deadline):
+                    heapq.heappop(self._heap); continue  # superseded by a later question or a new deadline
+                delay = deadline - time.time()
+                if delay > 0:
+                    self._cond.wait(delay); continue
+                heapq.heappop(self._heap)
+                del self._due[game_pin]
+                return game_pin, q_idx
+
+    def _run(self):
+        while True:
+            game_pin, q_idx = self._next_due()
+            try:
+                self.on_deadline(game_pin, q_idx)
+            except Exception:
+                logger.exception("Advancing game %s past question %s failed; retrying", game_pin, q_idx)
+                self.schedule(game_pin, q_idx, time.time() + self.retry_delay)
+
+def question_deadline(state):
+    """Epoch seconds at which the current timed question closes, or None if no timer is running."""
+    start = state.get("question_start_time") if state else None
+    if state is None or state.get("quiz_mode") != "timed_paced" or state.get("status") != "in_progress" or not start:
+        return None
+    return start.timestamp() + (state.get("time_per_question") or 60)
+
+class FirestorePool:
+    """A small pool of thread-safe Firestore clients, each with its own gRPC channel, handed out round-robin."""
+    def __init__(self, credentials_info, size=1):
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_info(dict(credentials_info))
+        self._clients = [firestore.Client(project=credentials.project_id, credentials=credentials) for _ in range(max(1, size))]
+        self._next = itertools.cycle(self._clients)
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock: return next(self._next)
+
+    def __getattr__(self, name):
+        # Lets the pool stand in for a client: `pool.collection(...)`, `pool.batch()` and so on.
+        return getattr(self.client(), name)
+
+
+class QuizBackend:
+    """Game operations over a Firestore-compatible client, shared by every session in a process."""
+    def __init__(self, db, max_games=256, sweep_interval=None, tally_shards=8, coordinator=None, flush_grace=0.5):
+        """`sweep_interval` (seconds) starts a `GameSweeper`; leave it None for short-lived tools and tests.
+        Replicas serving the same games should share one `coordinator` (see `coordination`); before
+        each question is scored they get `flush_grace` seconds to commit the answers they have buffered."""
+        self.db, self.max_games, self.tally_shards = db, max_games, tally_shards
+        self.flush_grace = flush_grace if coordinator is not None else 0
+        self.writes = PlayerWriteBuffer(db)
+        self.hub = GameStateHub(db, on_state=self._schedule_deadline, coordinator=coordinator, on_flush=self.writes.flush_soon)
+        self.scheduler = GameScheduler(self._on_deadline)
+        self._flushing = set()  # (pin, question index) deadlines waiting out the flush grace; scheduler thread only
+        self.banks = QuestionBankStore(db)
+        self.admission = AdmissionGate()
+        self.pins = PinAllocator(db)
+        self.sweeper = GameSweeper(db, self.pins, sweep_interval, coordinator=self.hub.coordinator, owner=self.hub.replica_id) if sweep_interval else None
+        self._lock = threading.Lock()
+        self._questions, self._engines = OrderedDict(), OrderedDict()
+
+    def _cached(self, cache, game_pin, factory):
+        with self._lock:
+            if game_pin in cache:
+                cache.move_to_end(game_pin)
+                return cache[game_pin]
+        value = factory()
+        with self._lock:
+            value = cache.setdefault(game_pin, value)
+            while len(cache) > self.max_games: cache.popitem(last=False)
+        return value
+
+    def game_ref(self, game_pin):
+        return self.db.collection("games").document(game_pin)
+
+    def player_ref(self, game_pin, player_name):
+        return self.game_ref(game_pin).collection("players").document(player_doc_id(player_name))
+
+    def tally_ref(self, game_pin, q_idx, player_name):
+        """Each player always counts into the same one of `tally_shards` documents per question."""
+        shard = int(player_doc_id(player_name)[:8], 16) % self.tally_shards
+        return self.game_ref(game_pin).collection("tallies").document(f"{q_idx}-{shard}")
+
+    def get_quiz_questions(self, game_pin):
+        """Quiz content is immutable once a game is created, so each process fetches it once per PIN."""
+        def load():
+            with timed("quiz.get", game_pin): content = self.game_ref(game_pin).collection("content").document("quiz").get().to_dict() or {}
+            count_io("quiz.get", game_pin, reads=1)
+            if "bank_id" not in content: return []
+            return ShuffledQuestions(self.banks.get(content["bank_id"]), content["order"])
+        return self._cached(self._questions, game_pin, load)
+
+    def get_scoring_engine(self, game_pin):
+        return self._cached(self._engines, game_pin, lambda: ScoringEngine(self.get_quiz_questions(game_pin)))
+
+    def load_answers(self, game_pin, q_idx):
+        """Reads one question's answers directly, bypassing the hub: only players who answered it are read."""
+        key, answers = str(q_idx), {}
+        with timed("answers.query", game_pin):
+            for doc in self.game_ref(game_pin).collection("players").where(f"answers.{key}", ">=", 0).stream():
+                data = doc.to_dict()
+                answers[data.get("name", doc.id)] = data["answers"][key]
+        count_io("answers.query", game_pin, reads=max(1, len(answers)))
+        return answers
+
+    def get_game_state(self, game_pin, session_id):
+        if not game_pin: return None
+        return self.hub.get(game_pin, session_id)
+
+    def leave_game(self, game_pin, session_id):
+        self.hub.release(game_pin, session_id)
+
+    def update_game_state(self, game_pin, new_state):
+        with timed("game.update", game_pin): self.game_ref(game_pin).update({**new_state, "version": firestore.Increment(1)})
+        count_io("game.update", game_pin, writes=1)
+        self.hub.refresh(game_pin)
+
+    def submit_answer(self, game_pin, player_name, q_idx, option_index, correct=None):
+        """Queues a player's answer (as an option index) and its tally; in instructor-paced mode `correct` also bumps their score."""
+        new_data = {f"answers.{q_idx}": option_index}
+        if correct: new_data["score"] = firestore.Increment(1)
+        self.writes.submit(self.player_ref(game_pin, player_name), new_data)
+        self.writes.submit(self.tally_ref(game_pin, q_idx, player_name), {f"o{option_index}": firestore.Increment(1)}, upsert=True)
+
+    def start_game(self, game_pin, quiz_mode):
+        update_data = {"status": "in_progress", "current_question_index": 0}
+        if quiz_mode == "timed_paced": update_data["question_start_time"] = firestore.SERVER_TIMESTAMP
+        self.update_game_state(game_pin, update_data)
+
+    def _schedule_deadline(self, game_pin, state):
+        deadline = question_deadline(state)
+        if deadline is not None: self.scheduler.schedule(game_pin, state["current_question_index"], deadline)
+        else: self.scheduler.cancel(game_pin)
+
+    def _on_deadline(self, game_pin, q_idx):
+        if self.flush_grace and (game_pin, q_idx) not in self._flushing:
+            # Wait out the grace on the heap rather than in the scheduler thread other games share.
+            self._flushing.add((game_pin, q_idx))
+            self.hub.request_flush(game_pin)
+            self.scheduler.schedule(game_pin, q_idx, time.time() + self.flush_grace)
+            return
+        flushed = (game_pin, q_idx) in self._flushing
+        self._flushing.discard((game_pin, q_idx))
+        self.advance_question(game_pin, q_idx, on_deadline=True, flushed=flushed)
+
+    def advance_question(self, game_pin, expected_idx, on_deadline=False, flushed=False):
+        """Moves the game past question `expected_idx` exactly once: to the next question, or to finished.
+
+        Runs as a transaction that only writes if the game is still showing `expected_idx`, so racing
+        host tabs, processes and the scheduler cannot double-advance. The question is scored inside the
+        same step (idempotently) from a fresh read of its answers, and finishing publishes the precomputed
+        results with the status change. Returns "advanced", "finished", "early" (timer not yet expired)
+        or "stale". Unless `flushed`, other replicas are first given `flush_grace` to commit the answers they hold.
+        """
+        if not flushed and self.flush_grace:
+            self.hub.request_flush(game_pin)
+            time.sleep(self.flush_grace)
+        self.writes.flush()
+        game_ref = self.game_ref(game_pin)
+
+        @transactional
+        def transition(transaction):
+            REGISTRY.inc("quizzicle_transaction_attempts_total", op="advance_question", pin=game_pin)
+            count_io("advance_question", game_pin, reads=1)
+            state = game_ref.get(transaction=transaction).to_dict()
+            if not state or state.get("status") != "in_progress" or state.get("current_question_index") != expected_idx:
+                return "stale", None
+            deadline = question_deadline(state)
+            if on_deadline and deadline is not None and deadline > time.time():
+                return "early", deadline
+            is_last = expected_idx >= state["num_questions"] - 1
+            engine = self.get_scoring_engine(game_pin)
+            engine.close_through(expected_idx, partial(self.load_answers, game_pin))
+            if is_last:
+                results = {"question_stats": engine.question_stats}
+                if state.get("quiz_mode") == "timed_paced": results["scores"] = engine.scores()
+                transaction.set(game_ref.collection("content").document("results"), results)
+                transaction.update(game_ref, {"status": "finished", "finished_at": firestore.SERVER_TIMESTAMP, "version": firestore.Increment(1)})
+                self.pins.mark_finished(transaction, game_pin)
+                return "finished", None
+            update_data = {"current_question_index": expected_idx + 1, "version": firestore.Increment(1)}
+            next_deadline = None
+            if state.get("quiz_mode") == "timed_paced":
+                update_data["question_start_time"] = firestore.SERVER_TIMESTAMP
+                next_deadline = time.time() + (state.get("time_per_question") or 60)
+            transaction.update(game_ref, update_data)
+            return "advanced", next_deadline
+
+        with timed("advance_question", game_pin): outcome, deadline = transition(self.db.transaction())
+        count_io("advance_question", game_pin, writes={"advanced": 1, "finished": 3}.get(outcome, 0))
+        if self.hub.is_follower(game_pin):
+            pass  # The replica that owns the game runs its timer; it sees this change through its listener.
+        elif outcome == "early":
+            self.scheduler.schedule(game_pin, expected_idx, deadline)
+        elif outcome == "advanced" and deadline is not None:
+            # The hub refines this from the server timestamp once it sees the new question.
+            self.scheduler.schedule(game_pin, expected_idx + 1, deadline)
+        if outcome in ("advanced", "finished"): self.hub.refresh(game_pin)
+        return outcome
+
+    def create_game_session(self, host_name, bank_id, num_questions, quiz_mode, time_per_question):
+        """Creates a game over a compiled bank; only a shuffled index permutation is stored with the game."""
+        def write_game(batch, game_pin):
+            batch.create(self.game_ref(game_pin).collection("content").document("quiz"), {"bank_id": bank_id, "order": random.sample(range(num_questions), num_questions)})
+            batch.create(self.game_ref(game_pin), {
+                "host": host_name, "bank_id": bank_id, "num_questions": num_questions,
+                "current_question_index": -1, "status": "waiting", "created_at": firestore.SERVER_TIMESTAMP,
+                "quiz_mode": quiz_mode, "time_per_question": int(time_per_question) if time_per_question else None,
+                "question_start_time": None, "version": 0
+            })
+        return self.pins.reserve(write_game)
+
+    def join_game(self, game_pin, player_name, join_token=None):
+        """Registers a player by creating their document only if it is absent.
+
+        Cost is constant in the number of players: one read of the small game document (skipped when
+        this process already watches the game) and one create. `join_token` identifies the joining
+        session, so a retried create that actually landed is recognised as this player's own join
+        rather than reported as a taken name.
+        """
+        join_token = join_token or uuid.uuid4().hex
+
+        def result(outcome, ok, message):
+            REGISTRY.inc("quizzicle_joins_total", outcome=outcome)
+            return ok, message
+
+        try:
+            with self.admission.admit():
+                state = self.hub.peek_state(game_pin)
+                if state is None:
+                    with timed("join.get_game", game_pin): state = self.game_ref(game_pin).get().to_dict()
+                    count_io("join.get_game", game_pin, reads=1)
+                if state is None: return result("not_found", False, "Game not found.")
+                if state.get("status") == "finished": return result("finished", False, "This game has already finished.")
+                player_ref = self.player_ref(game_pin, player_name)
+                for attempt in range(3):
+                    try:
+                        with timed("join.create", game_pin): player_ref.create({"name": player_name, "score": 0, "answers": {}, "join_token": join_token})
+                        count_io("join.create", game_pin, writes=1)
+                        return result("joined", True, "Success.")
+                    except AlreadyExists:
+                        with timed("join.get_player", game_pin): existing = player_ref.get().to_dict() or {}
+                        count_io("join.get_player", game_pin, reads=1)
+                        if existing.get("join_token") == join_token: return result("joined", True, "Success.")
+                        return result("name_taken", False, "This name is already taken.")
+                    except (ServiceUnavailable, DeadlineExceeded):
+                        if attempt == 2: raise
+                        REGISTRY.inc("quizzicle_join_retries_total", pin=game_pin)
+                        time.sleep(0.1 * 2 ** attempt + random.uniform(0, 0.1))
+        except AdmissionRejected:
+            return result("rejected", False, "Lots of players are joining right now. Please try again in a moment.")
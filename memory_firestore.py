@@ -0,0 +1,421 @@
+"""An in-memory stand-in for the parts of the Firestore client API Quizzicle uses.
+
+`MemoryClient` mirrors `google.cloud.firestore.Client` closely enough to run every game flow
+offline: collections and subcollections, documents with `get`/`set`/`create`/`update`/`delete`,
+dotted field paths, the `Increment`, `SERVER_TIMESTAMP` and `DELETE_FIELD` sentinels, batches,
+optimistic transactions, simple queries and `on_snapshot` listeners. It counts the reads,
+writes and transaction retries a real project would bill for, so load tests can report them.
+"""
+import copy
+import datetime
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+
+from google.api_core.exceptions import Aborted, AlreadyExists, NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+logger = logging.getLogger(__name__)
+
+_OPERATORS = {
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b, "not-in": lambda a, b: a not in b,
+    "array-contains": lambda a, b: isinstance(a, list) and b in a,
+}
+_MISSING = object()
+
+def _get_field(data, field_path):
+    for part in field_path.split("."):
+        if not isinstance(data, dict) or part not in data: return _MISSING
+        data = data[part]
+    return data
+
+def _resolve(value, current, now):
+    """Turns write sentinels into stored values, given the field's current value."""
+    if value is firestore.SERVER_TIMESTAMP: return now
+    if isinstance(value, firestore.Increment):
+        return current + value.value if isinstance(current, (int, float)) and not isinstance(current, bool) else value.value
+    if isinstance(value, dict):
+        return {k: _resolve(v, _MISSING, now) for k, v in value.items() if v is not firestore.DELETE_FIELD}
+    return copy.deepcopy(value)
+
+def _set_field(data, field_path, value, now):
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict): data[part] = {}
+        data = data[part]
+    if value is firestore.DELETE_FIELD: data.pop(parts[-1], None)
+    else: data[parts[-1]] = _resolve(value, data.get(parts[-1], _MISSING), now)
+
+def _merge(target, updates, now):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict): _merge(target[key], value, now)
+        elif value is firestore.DELETE_FIELD: target.pop(key, None)
+        else: target[key] = _resolve(value, target.get(key, _MISSING), now)
+
+class MemoryStats:
+    """Thread-safe counters for billable operations."""
+    FIELDS = ("reads", "writes", "commits", "listener_reads", "transactions", "transaction_retries")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def add(self, field, n=1):
+        with self._lock: setattr(self, field, getattr(self, field) + n)
+
+    def reset(self):
+        with self._lock:
+            for field in self.FIELDS: setattr(self, field, 0)
+
+    def snapshot(self):
+        with self._lock: return {field: getattr(self, field) for field in self.FIELDS}
+
+class MemorySnapshot:
+    def __init__(self, reference, data, read_time, create_time=None, update_time=None):
+        self.reference, self._data, self.read_time = reference, data, read_time
+        self.create_time, self.update_time = create_time, update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING: raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+class _Watch:
+    def __init__(self, client, target, callback):
+        self.client, self.target, self.callback = client, target, callback
+        self.docs = {}  # path -> snapshot currently in the result set
+
+    def unsubscribe(self):
+        self.client._remove_watch(self)
+
+class MemoryDocument:
+    def __init__(self, client, path):
+        self._client, self._path = client, tuple(path)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocument) and other._path == self._path
+
+    def __hash__(self):
+        return hash(self._path)
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    @property
+    def path(self):
+        return "/".join(self._path)
+
+    @property
+    def parent(self):
+        return MemoryCollection(self._client, self._path[:-1])
+
+    def collection(self, collection_id):
+        return MemoryCollection(self._client, self._path + (collection_id,))
+
+    def collections(self):
+        return [self.collection(name) for name in self._client._subcollections(self._path)]
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._rpc()
+        snapshot = self._client._read(self._path)
+        if transaction is not None: transaction._record_read(self._path, snapshot)
+        return snapshot
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([("set", self._path, document_data, merge)])
+
+    def create(self, document_data):
+        return self._client._commit([("create", self._path, document_data, False)])
+
+    def update(self, field_updates):
+        return self._client._commit([("update", self._path, field_updates, False)])
+
+    def delete(self):
+        return self._client._commit([("delete", self._path, None, False)])
+
+    def on_snapshot(self, callback):
+        return self._client._add_watch(self, callback)
+
+class MemoryQuery:
+    def __init__(self, client, parent_path, filters=(), orders=(), limit=None, cursor=None):
+        self._client, self._parent_path = client, tuple(parent_path)
+        self._filters, self._orders, self._limit, self._cursor = filters, orders, limit, cursor
+
+    def _copy(self, **changes):
+        fields = {"filters": self._filters, "orders": self._orders, "limit": self._limit, "cursor": self._cursor, **changes}
+        return MemoryQuery(self._client, self._parent_path, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None: field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def _matches(self, data):
+        for field_path, op_string, value in self._filters:
+            field = _get_field(data, field_path)
+            if field is _MISSING: return False
+            try:
+                if not _OPERATORS[op_string](field, value): return False
+            except TypeError:
+                return False
+        return all(_get_field(data, field_path) is not _MISSING for field_path, _ in self._orders)
+
+    def _sort_key(self, path, data):
+        return tuple(_get_field(data, field_path) for field_path, _ in self._orders) + (path[-1],)
+
+    def _run(self, snapshots):
+        rows = [s for s in snapshots if self._matches(s._data)]
+        for field_path, direction in reversed(self._orders):
+            rows.sort(key=lambda s: _get_field(s._data, field_path), reverse=direction == "DESCENDING")
+        if self._cursor is not None:
+            cursor = self._cursor
+            after = (self._sort_key(cursor.reference._path, cursor._data) if isinstance(cursor, MemorySnapshot)
+                     else tuple(cursor[field_path] for field_path, _ in self._orders))
+            keys = [self._sort_key(s.reference._path, s._data)[:len(after)] for s in rows]
+            descending = bool(self._orders) and self._orders[0][1] == "DESCENDING"
+            rows = [s for s, key in zip(rows, keys) if (key < after if descending else key > after)]
+        return rows[:self._limit] if self._limit is not None else rows
+
+    def stream(self, transaction=None):
+        self._client._rpc()
+        snapshots = self._run(self._client._read_collection(self._parent_path, count=False))
+        self._client.stats.add("reads", max(1, len(snapshots)))
+        if transaction is not None:
+            for snapshot in snapshots: transaction._record_read(snapshot.reference._path, snapshot)
+        return iter(snapshots)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return self._client._add_watch(self, callback)
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._parent_path[-1]
+
+    def document(self, document_id=None):
+        return MemoryDocument(self._client, self._parent_path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, document_data):
+        ref = self.document()
+        return ref.create(document_data), ref
+
+    def list_documents(self):
+        return [MemoryDocument(self._client, path) for path in self._client._child_documents(self._parent_path)]
+
+class MemoryBatch:
+    def __init__(self, client):
+        self._client, self._ops = client, []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference._path, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference._path, document_data, False))
+
+    def update(self, reference, field_updates):
+        self._ops.append(("update", reference._path, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference._path, None, False))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        return self._client._commit(ops)
+
+class MemoryTransaction(MemoryBatch):
+    """Optimistic transaction: commits only if nothing it read has changed since, else it is retried.
+
+    `run(func)` plays the part of `firestore.transactional(func)(transaction)`.
+    """
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self.max_attempts, self._reads = max_attempts, {}
+
+    def _record_read(self, path, snapshot):
+        self._reads.setdefault(path, snapshot.update_time)
+
+    def run(self, func, *args, **kwargs):
+        self._client.stats.add("transactions")
+        for attempt in range(self.max_attempts):
+            self._ops, self._reads = [], {}
+            result = func(self, *args, **kwargs)
+            try:
+                self._client._commit(self._ops, expected=self._reads)
+                return result
+            except Aborted:
+                self._client.stats.add("transaction_retries")
+                time.sleep(random.uniform(0, 0.002 * 2 ** attempt))
+        raise ValueError(f"Transaction failed after {self.max_attempts} attempts.")
+
+class MemoryClient:
+    """Process-local Firestore. `latency` (seconds) is slept once per simulated RPC to mimic the network;
+    `listener_delay` (seconds) holds back each listener delivery, as a lagging watch stream would."""
+    def __init__(self, latency=0.0, listener_delay=0.0):
+        self.latency, self.listener_delay = latency, listener_delay
+        self.stats = MemoryStats()
+        self._lock = threading.RLock()
+        self._docs = {}  # path tuple -> (data, create_time, update_time)
+        self._watches = []
+        self._last_time = None
+        self._events = queue.Queue()
+        threading.Thread(target=self._dispatch, name="memory-firestore-listeners", daemon=True).start()
+
+    def collection(self, collection_id):
+        return MemoryCollection(self, (collection_id,))
+
+    def document(self, document_path):
+        return MemoryDocument(self, tuple(document_path.split("/")))
+
+    def batch(self):
+        return MemoryBatch(self)
+
+    def transaction(self, max_attempts=5):
+        return MemoryTransaction(self, max_attempts)
+
+    def _rpc(self):
+        if self.latency: time.sleep(self.latency)
+
+    def _now(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self._last_time is not None and now <= self._last_time:
+            now = self._last_time + datetime.timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _snapshot(self, path, read_time):
+        data, create_time, update_time = self._docs.get(path, (None, None, None))
+        return MemorySnapshot(MemoryDocument(self, path), copy.deepcopy(data), read_time, create_time, update_time)
+
+    def _read(self, path):
+        self.stats.add("reads")
+        with self._lock: return self._snapshot(path, self._now())
+
+    def _read_collection(self, parent_path, count=True):
+        with self._lock:
+            now = self._now()
+            snapshots = [self._snapshot(path, now) for path in sorted(self._child_documents(parent_path, existing=True))]
+        if count: self.stats.add("reads", max(1, len(snapshots)))
+        return snapshots
+
+    def _child_documents(self, parent_path, existing=False):
+        depth = len(parent_path) + 1
+        with self._lock:
+            paths = {path[:depth] for path in self._docs if len(path) >= depth and path[:depth - 1] == parent_path}
+            return [path for path in paths if not existing or path in self._docs]
+
+    def _subcollections(self, doc_path):
+        depth = len(doc_path) + 1
+        with self._lock:
+            return sorted({path[depth - 1] for path in self._docs if len(path) > depth and path[:depth - 1] == doc_path})
+
+    def _commit(self, ops, expected=None):
+        self._rpc()
+        with self._lock:
+            for path, update_time in (expected or {}).items():
+                if self._docs.get(path, (None, None, None))[2] != update_time:
+                    raise Aborted(f"Document {'/'.join(path)} changed during the transaction.")
+            now, pending = self._now(), {}
+            for kind, path, data, merge in ops:
+                current = pending[path] if path in pending else self._docs.get(path, (None,))[0]
+                if kind == "create" and current is not None: raise AlreadyExists(f"Document already exists: {'/'.join(path)}")
+                if kind == "update" and current is None: raise NotFound(f"No document to update: {'/'.join(path)}")
+                if kind == "delete": pending[path] = None
+                elif kind == "update":
+                    new = copy.deepcopy(current)
+                    for field_path, value in data.items(): _set_field(new, field_path, value, now)
+                    pending[path] = new
+                elif merge and current is not None:
+                    new = copy.deepcopy(current); _merge(new, data, now); pending[path] = new
+                else:
+                    pending[path] = _resolve(data, _MISSING, now)
+            for path, data in pending.items():
+                if data is None: self._docs.pop(path, None)
+                else:
+                    create_time = self._docs[path][1] if path in self._docs else now
+                    self._docs[path] = (data, create_time, now)
+            self.stats.add("writes", len(ops)); self.stats.add("commits")
+            for watch in list(self._watches): self._notify(watch, set(pending), now)
+        return now
+
+    def _add_watch(self, target, callback):
+        watch = _Watch(self, target, callback)
+        with self._lock:
+            self._watches.append(watch)
+            now = self._now()
+            if isinstance(target, MemoryDocument): paths = {target._path}
+            else: paths = set(self._child_documents(target._parent_path, existing=True))
+            self._notify(watch, paths, now, initial=True)
+        return watch
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches: self._watches.remove(watch)
+
+    def _notify(self, watch, paths, now, initial=False):
+        """Queues the listener callback for whichever of `paths` fall inside the watch's target."""
+        target = watch.target
+        if isinstance(target, MemoryDocument):
+            if target._path not in paths: return
+            snapshot = self._snapshot(target._path, now)
+            self.stats.add("listener_reads")
+            self._events.put((time.monotonic() + self.listener_delay, watch, [snapshot], [], now))
+            return
+        changes = []
+        for path in sorted(paths):
+            if path[:-1] != target._parent_path: continue
+            snapshot = self._snapshot(path, now)
+            was_in, now_in = path in watch.docs, snapshot.exists and target._matches(snapshot._data)
+            if now_in:
+                watch.docs[path] = snapshot
+                changes.append(DocumentChange(ChangeType.MODIFIED if was_in else ChangeType.ADDED, snapshot, -1, -1))
+            elif was_in:
+                changes.append(DocumentChange(ChangeType.REMOVED, watch.docs.pop(path), -1, -1))
+        if not changes and not initial: return
+        self.stats.add("listener_reads", max(1, len(changes)))
+        self._events.put((time.monotonic() + self.listener_delay, watch, target._run(watch.docs.values()), changes, now))
+
+    def _dispatch(self):
+        while True:
+            due, watch, docs, changes, read_time = self._events.get()
+            if due > time.monotonic(): time.sleep(due - time.monotonic())
+            if watch not in self._watches: continue
+            try:
+                watch.callback(docs, changes, read_time)
+            except Exception:
+                logger.exception("Listener callback failed")
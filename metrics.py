@@ -0,0 +1,177 @@
+"""Process-wide counters and timers for Quizzicle's hot paths, exportable as Prometheus text or JSON.
+
+A series is a metric name plus its labels (game PIN, role, operation, status). `REGISTRY` is shared
+by every session in the process: the backend times each Firestore call and counts the documents it
+reads and writes, and the app times each screen render.
+
+    with REGISTRY.timer("quizzicle_firestore_seconds", op="game.get", pin=pin): ...
+    REGISTRY.inc("quizzicle_firestore_reads_total", 3, op="listener.players", pin=pin)
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "quizzicle_firestore_seconds": "Latency of Firestore calls by operation, game PIN and status.",
+    "quizzicle_firestore_reads_total": "Firestore documents read (billed reads), by operation and game PIN.",
+    "quizzicle_firestore_writes_total": "Firestore documents written, by operation and game PIN.",
+    "quizzicle_transaction_attempts_total": "Transaction attempts, including retries after contention.",
+    "quizzicle_join_retries_total": "Player registrations retried after a transient Firestore error.",
+    "quizzicle_joins_total": "Join attempts by outcome.",
+    "quizzicle_pin_collisions_total": "Game creations that hit an already reserved PIN.",
+    "quizzicle_screen_seconds": "Script run time of each screen, by role, game PIN and game status.",
+    "quizzicle_rerun_checks_total": "Version polls from idle sessions, and whether they triggered a rerun.",
+    "quizzicle_fanout_messages_total": "Game diffs published by the replica that owns a game, by kind.",
+    "quizzicle_fanout_received_total": "Game diffs applied (or resynchronised from) by follower replicas, by kind.",
+}
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms keyed by (name, labels).
+
+    Label values are stored as strings. Once `max_series` series exist, new ones are dropped (and
+    counted) rather than letting a flood of PINs grow the process without bound; `forget` drops
+    the series of games that no longer exist.
+    """
+    def __init__(self, buckets=BUCKETS, max_series=20000):
+        self.buckets, self.max_series = tuple(buckets), max_series
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._timers = {}  # (name, labels) -> [count, sum, max, *bucket counts]
+        self.dropped = 0
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+    def _has_room(self, key, series):
+        if key in series or len(self._counters) + len(self._timers) < self.max_series: return True
+        self.dropped += 1
+        return False
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if self._has_room(key, self._counters): self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if not self._has_room(key, self._timers): return
+            timer = self._timers.get(key)
+            if timer is None: timer = self._timers[key] = [0, 0.0, 0.0] + [0] * len(self.buckets)
+            timer[0] += 1; timer[1] += seconds; timer[2] = max(timer[2], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    timer[3 + i] += 1; break
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the block; yields its labels so the body can add to them (a PIN learned late, a status).
+
+        `status` defaults to "ok", or to the exception's class name when the block raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        except BaseException as exc:
+            labels.setdefault("status", type(exc).__name__)
+            raise
+        finally:
+            labels.setdefault("status", "ok")
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def forget(self, **labels):
+        """Drops every series carrying all of the given labels, e.g. `forget(pin=...)` for a deleted game."""
+        wanted = set(self._key("", labels)[1])
+        with self._lock:
+            for series in (self._counters, self._timers):
+                for key in [key for key in series if wanted <= set(key[1])]: del series[key]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear(); self._timers.clear()
+            self.dropped, self.started = 0, time.time()
+
+    def _quantile(self, timer, q):
+        """Upper bound of the bucket holding the q-th quantile; the observed max past the last bucket."""
+        rank, seen = q * timer[0], 0
+        for bound, count in zip(self.buckets, timer[3:]):
+            seen += count
+            if seen >= rank: return min(bound, timer[2])
+        return timer[2]
+
+    def totals(self, name, by):
+        """Sums a counter over every label but `by`, largest first: e.g. reads per game PIN."""
+        sums = defaultdict(float)
+        with self._lock:
+            for (metric, labels), value in self._counters.items():
+                if metric == name: sums[dict(labels).get(by, "")] += value
+        return sorted(sums.items(), key=lambda item: -item[1])
+
+    def timings(self, name, by):
+        """Folds a timer's series by the labels in `by`: count, mean, p95 and max in milliseconds."""
+        folded = {}
+        with self._lock:
+            for (metric, labels), timer in self._timers.items():
+                if metric != name: continue
+                group = tuple(dict(labels).get(label, "") for label in by)
+                acc = folded.setdefault(group, [0, 0.0, 0.0] + [0] * len(self.buckets))
+                acc[0] += timer[0]; acc[1] += timer[1]; acc[2] = max(acc[2], timer[2])
+                for i, count in enumerate(timer[3:]): acc[3 + i] += count
+        rows = [{**dict(zip(by, group)), "count": acc[0], "mean_ms": 1000 * acc[1] / acc[0],
+                 "p95_ms": 1000 * self._quantile(acc, 0.95), "max_ms": 1000 * acc[2]} for group, acc in folded.items()]
+        return sorted(rows, key=lambda row: -row["count"] * row["mean_ms"])
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self._counters.items())]
+            timers = [{"name": name, "labels": dict(labels), "count": t[0], "sum": t[1], "max": t[2],
+                       "buckets": dict(zip(map(str, self.buckets), t[3:]))} for (name, labels), t in sorted(self._timers.items())]
+            return {"started": self.started, "uptime_seconds": time.time() - self.started,
+                    "dropped_series": self.dropped, "counters": counters, "timers": timers}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Renders every series in the Prometheus text exposition format (timers as histograms)."""
+        with self._lock:
+            counters, timers = sorted(self._counters.items()), sorted(self._timers.items())
+            dropped = self.dropped
+        lines, described = [], set()
+
+        def describe(name, kind):
+            if name in described: return
+            described.add(name)
+            if name in HELP: lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), timer in timers:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, timer[3:]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {timer[0]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {timer[1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {timer[0]}")
+        lines.append("# TYPE quizzicle_metrics_dropped_series_total counter")
+        lines.append(f"quizzicle_metrics_dropped_series_total {dropped}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
@@ -1,31 +1,25 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import time
-import random
-import string
+import os
 import io
-import qrcode
-from PIL import Image
-from google.cloud import firestore
-from streamlit_autorefresh import st_autorefresh
-import math
+import uuid
+from coordination import RedisCoordinator
+from game_backend import OPTION_MARKERS, FirestorePool, QuizBackend, QuizParseError, question_deadline
+from memory_firestore import MemoryClient
+from metrics import REGISTRY
 
 # --- App Branding and Configuration ---
 APP_NAME = "Quizzicle"
 LOGO_URL = "Loading image.jpeg"
 PLAYER_MODE_URL = "https://blank-app-s5sx65i2mng.streamlit.app/" # REMINDER: Change this URL
+LEADERBOARD_TOP_K = 10
+CLOSING_SECONDS = 5  # polls speed up this close to a timed question's deadline
 
 st.set_page_config(page_title=APP_NAME, page_icon="🏆", layout="wide")
 
 # --- Custom CSS for Styling ---
-def local_css(file_name):
-    try:
-        with open(file_name) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-    except FileNotFoundError:
-        st.error(f"Could not find {file_name}. A default style will be used.")
-
-with open("style.css", "w") as f:
-    f.write("""
+APP_CSS = """
     /* General Styles */
     body { font-family: 'Poppins', sans-serif; color: #31333F; }
     [data-testid="stAppViewContainer"] { background-color: #f0f2f6; }
@@ -37,101 +31,178 @@ with open("style.css", "w") as f:
     h1, h2, h3 { color: #31333F; }
     .game-pin-display { font-size: 3rem; font-weight: bold; color: #e59954; text-align: center; background-color: #ffffff; padding: 1rem; border-radius: 10px; letter-spacing: 0.5rem; border: 3px dashed #d9addd; }
     @media (max-width: 768px) { .game-pin-display { font-size: 2rem; letter-spacing: 0.2rem; } [data-testid="stSidebar"] { display: none; } }
-    """)
-local_css("style.css")
+    """
+
+COUNTDOWN_HTML = """
+<div style="font-family: 'Poppins', sans-serif; color: #31333F;">
+  <div style="background: #f0f2f6; border-radius: 6px; height: 10px;"><div id="bar" style="background: #c96b99; border-radius: 6px; height: 10px;"></div></div>
+  <div id="label" style="margin-top: 4px;">⏰</div>
+</div>
+<script>
+  const deadline = __DEADLINE_MS__, total = __TOTAL_MS__;
+  function tick() {
+    const left = Math.max(0, deadline - Date.now());
+    document.getElementById("bar").style.width = (100 * left / total) + "%";
+    document.getElementById("label").textContent = "⏰ " + Math.ceil(left / 1000) + "s";
+    if (left > 0) setTimeout(tick, 250);
+  }
+  tick();
+</script>
+"""
+
+@st.cache_resource
+def get_style_tag():
+    """Builds the minified <style> block once per process; every rerun just re-emits the cached string."""
+    return "<style>" + " ".join(line.strip() for line in APP_CSS.splitlines() if line.strip()) + "</style>"
+
+@st.cache_resource
+def get_logo_bytes():
+    try:
+        with open(LOGO_URL, "rb") as f: return f.read()
+    except OSError:
+        return None
+
+st.markdown(get_style_tag(), unsafe_allow_html=True)
 
 # --- Firebase Authentication ---
+@st.cache_resource
+def get_backend():
+    """One backend per process. Set QUIZZICLE_BACKEND=memory to run against the in-memory Firestore.
+
+    With REDIS_URL set, replicas share game listeners, timers and the sweeper through Redis.
+    """
+    if os.environ.get("QUIZZICLE_BACKEND") == "memory":
+        return QuizBackend(MemoryClient(), sweep_interval=600)
+    coordinator = RedisCoordinator(st.secrets["REDIS_URL"]) if st.secrets.get("REDIS_URL") else None
+    return QuizBackend(FirestorePool(st.secrets["FIRESTORE_CREDENTIALS"], size=int(st.secrets.get("FIRESTORE_CHANNEL_POOL_SIZE", 1))),
+                       sweep_interval=int(st.secrets.get("SWEEP_INTERVAL_SECONDS", 600)), coordinator=coordinator)
+
 try:
-    if "db" not in st.session_state:
-        st.session_state.db = firestore.Client.from_service_account_info(st.secrets["FIRESTORE_CREDENTIALS"])
+    get_backend()
 except Exception as e:
     st.error("🔥 Firebase connection failed. Have you set up your Streamlit secrets correctly?")
     st.stop()
 
-# --- Helper & Firestore Functions ---
-def parse_text_quiz(text_contents):
-    quiz_data, current_question = [], None
-    for line in text_contents.strip().split('\n'):
-        line = line.strip()
-        if not line and current_question:
-            if all(k in current_question for k in ['question', 'options', 'answer']): quiz_data.append(current_question)
-            current_question = None
-        elif line.startswith("Q:") and not current_question:
-            current_question = {"options": []}
-            current_question["question"] = line[2:].strip()
-        elif line.startswith("O:") and current_question: current_question["options"].append(line[2:].strip())
-        elif line.startswith("A:") and current_question: current_question["answer"] = line[2:].strip()
-    if current_question and all(k in current_question for k in ['question', 'options', 'answer']):
-        quiz_data.append(current_question)
-    return quiz_data
+# --- Session Helpers ---
+def get_session_id():
+    if "session_id" not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
 
 def get_game_state(game_pin):
-    if not game_pin: return None
-    return st.session_state.db.collection("games").document(game_pin).get().to_dict()
-
-def update_game_state(game_pin, new_state):
-    st.session_state.db.collection("games").document(game_pin).update(new_state)
-
-def calculate_final_scores(game_state):
-    """Calculates or preserves scores based on the quiz mode."""
-    questions = game_state.get('questions', [])
-    players = game_state.get('players', {})
-    quiz_mode = game_state.get('quiz_mode')
-    new_players_data = players.copy()
-    for player_name, player_data in new_players_data.items():
-        if quiz_mode == 'timed_paced':
-            score = 0
-            player_answers = player_data.get('answers', {})
-            for q_idx, answer in player_answers.items():
-                try:
-                    if answer == questions[int(q_idx)]['answer']:
-                        score += 1
-                except (IndexError, KeyError):
-                    continue
-            player_data['score'] = score
-    return new_players_data
-
-def create_game_session(host_name, quiz_data, quiz_mode, time_per_question):
-    game_pin = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    game_ref = st.session_state.db.collection("games").document(game_pin)
-    game_data = {
-        "host": host_name, "players": {}, "questions": random.sample(quiz_data, len(quiz_data)),
-        "current_question_index": -1, "status": "waiting", "created_at": firestore.SERVER_TIMESTAMP,
-        "quiz_mode": quiz_mode, "time_per_question": int(time_per_question) if time_per_question else None,
-        "question_start_time": None
-    }
-    game_ref.set(game_data)
-    return game_pin
-
-def join_game(game_pin, player_name):
-    game_ref = st.session_state.db.collection("games").document(game_pin)
-    @firestore.transactional
-    def update_in_transaction(transaction, game_ref, player_name):
-        snapshot = game_ref.get(transaction=transaction)
-        if not snapshot.exists: return False, "Game not found."
-        players = snapshot.get("players")
-        if player_name in players: return False, "This name is already taken."
-        players[player_name] = {"score": 0}
-        transaction.update(game_ref, {"players": players})
-        return True, "Success."
-    return update_in_transaction(st.session_state.db.transaction(), game_ref, player_name)
+    return get_backend().get_game_state(game_pin, get_session_id())
+
+def get_screen_state(game_pin):
+    """The game state a screen draws from; also gives `run_screen` the game's status for its timer."""
+    game_state = get_game_state(game_pin)
+    st.session_state.screen_status = game_state["status"] if game_state else "none"
+    return game_state
+
+def leave_game(game_pin):
+    get_backend().leave_game(game_pin, get_session_id())
+
+def render_key(game_state, player_name=None):
+    """What a drawn screen depends on: the game's version, whether the timer is closing or has run out
+    and the top K, plus the player count and answer tallies for the host, or a player's own record and rank.
+
+    Players leave the tallies and everyone else's answers out, so an answer burst reruns only the host.
+    """
+    if game_state is None: return None
+    deadline = question_deadline(game_state)
+    leaderboard = game_state["leaderboard"]
+    left = deadline - time.time() if deadline is not None else None
+    # Entering the closing window reruns the script, so `refresh_interval` switches to fast polls.
+    key = (game_state.get("version"), left is not None and left < CLOSING_SECONDS, left is not None and left <= 0,
+           leaderboard.top(LEADERBOARD_TOP_K))
+    if player_name is None: return key + (game_state.get("answers_version"), len(game_state.get("players", {})))
+    return key + (game_state.get("players", {}).get(player_name), leaderboard.rank(player_name), len(leaderboard))
+
+def refresh_interval(game_state):
+    """Seconds between version checks: slow in the lobby, fast while a timed question is about to close."""
+    status = game_state["status"]
+    if status == "finished": return None
+    if status == "waiting": return 3
+    deadline = question_deadline(game_state)
+    if deadline is not None and deadline - time.time() < CLOSING_SECONDS: return 0.5
+    return 1
+
+def watch_for_changes(game_pin, game_state, player_name=None):
+    """Polls the in-memory snapshot from a fragment and reruns the whole script only when it changed.
+
+    Unchanged ticks re-execute just this fragment, which draws nothing, so idle sessions cost a
+    dictionary lookup instead of a full render.
+    """
+    interval = refresh_interval(game_state)
+    if interval is None: return
+    drawn = render_key(game_state, player_name)
+
+    @st.fragment(run_every=interval)
+    def poll_game_version():
+        changed = render_key(get_game_state(game_pin), player_name) != drawn
+        REGISTRY.inc("quizzicle_rerun_checks_total", pin=game_pin, role=st.session_state.role, changed=changed)
+        if changed: st.rerun()
+    poll_game_version()
+
+def run_screen(screen):
+    """Runs a screen under a timer tagged with the session's role, its game PIN and the game's status."""
+    game_pin = st.session_state.get("game_pin")
+    with REGISTRY.timer("quizzicle_screen_seconds", screen=screen.__name__, role=st.session_state.get("role"), pin=game_pin) as labels:
+        st.session_state.screen_status = "none"
+        try:
+            screen()
+        finally:
+            labels["status"] = st.session_state.screen_status
 
 # --- UI Components ---
-def show_leaderboard(players):
+def show_leaderboard(leaderboard, player_name=None, top_k=LEADERBOARD_TOP_K):
+    """Renders the top K players, plus the current player's own row when they fall outside it."""
     st.sidebar.header("🏆 Leaderboard")
-    if not players:
+    if not len(leaderboard):
         st.sidebar.write("No players yet...")
         return
-    sorted_players = sorted(players.items(), key=lambda item: item[1].get('score', 0), reverse=True)
-    for i, (name, data) in enumerate(sorted_players):
+    for i, (name, score) in enumerate(leaderboard.top(top_k)):
         medal = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else ""
-        st.sidebar.markdown(f"**{medal} {name}**: {data.get('score', 0)}")
+        st.sidebar.markdown(f"**{medal} {name}**: {score}")
+    rank, score = leaderboard.rank(player_name) if player_name else (None, 0)
+    if rank is not None and rank >= top_k:
+        st.sidebar.markdown(f"…\n\n**#{rank + 1} {player_name}**: {score}")
+
+def show_answer_histogram(question, counts, num_players):
+    """Live answer bars for the host, drawn from the pre-summed tallies: one row per option, whatever the player count."""
+    answered = sum(counts.values())
+    st.caption(f"**{answered} of {num_players}** answered")
+    for i, opt in enumerate(question.options):
+        n = counts.get(i, 0)
+        st.progress(n / answered if answered else 0.0, text=f"{OPTION_MARKERS[i]} {opt} — {n}")
+
+def question_difficulty_rows(questions, answer_counts):
+    rows = []
+    for i, q in enumerate(questions):
+        counts = answer_counts.get(i, {})
+        answered, correct = sum(counts.values()), counts.get(q.answer_index, 0)
+        share = correct / answered if answered else None
+        wrong = max((o for o in counts if o != q.answer_index and counts[o]), key=counts.get, default=None)
+        rows.append({"#": i + 1, "Question": q.question, "Answer": q.answer, "Answered": answered,
+                     "Correct %": round(100 * share) if share is not None else None,
+                     "Difficulty": "" if share is None else "Easy" if share >= 0.75 else "Medium" if share >= 0.4 else "Hard",
+                     "Top wrong answer": q.options[wrong] if wrong is not None else ""})
+    return rows
 
 def show_game_logo():
-    try:
-        st.image(LOGO_URL, width=100, use_container_width=False)
-    except:
-        st.write(f"_{APP_NAME}_")
+    logo = get_logo_bytes()
+    if logo: st.image(logo, width=100, use_container_width=False)
+    else: st.write(f"_{APP_NAME}_")
+
+def show_countdown(deadline, time_per_q):
+    """Renders a timer bar that ticks in the browser, so no rerun is needed to animate it."""
+    if deadline is None:
+        st.progress(1.0, text=f":alarm_clock: {time_per_q}s"); return
+    components.html(COUNTDOWN_HTML.replace("__DEADLINE_MS__", str(int(deadline * 1000))).replace("__TOTAL_MS__", str(int(time_per_q * 1000))), height=48)
+
+@st.cache_data(max_entries=512)
+def make_join_qr_png(game_pin):
+    import qrcode  # Only the host screen needs qrcode/PIL, so players never pay for the import.
+    buf = io.BytesIO(); qrcode.make(f"{PLAYER_MODE_URL}?pin={game_pin}").save(buf, "PNG")
+    return buf.getvalue()
 
 # --- Screen Definitions ---
 def main_selection_screen():
@@ -176,25 +247,25 @@ def host_create_game_screen():
                 st.session_state.create_game_error = "Please enter your name and upload a quiz file."
             else:
                 try:
-                    quiz_data = parse_text_quiz(io.StringIO(uploaded_file.getvalue().decode("utf-8")).read())
-                    if quiz_data:
-                        mode_map = {"Instructor-Paced": "instructor_paced", "Timed Questions (Instructor-Led)": "timed_paced"}
-                        st.session_state.game_pin = create_game_session(host_name, quiz_data, mode_map[quiz_mode], time_per_q)
-                        if 'create_game_error' in st.session_state: del st.session_state.create_game_error
-                    else:
-                        st.session_state.create_game_error = "Invalid TXT format or empty file."
+                    bank_id, questions = get_backend().banks.compile_upload(uploaded_file)
+                    mode_map = {"Instructor-Paced": "instructor_paced", "Timed Questions (Instructor-Led)": "timed_paced"}
+                    st.session_state.game_pin = get_backend().create_game_session(host_name, bank_id, len(questions), mode_map[quiz_mode], time_per_q)
+                    if 'create_game_error' in st.session_state: del st.session_state.create_game_error
+                except QuizParseError as e:
+                    shown = "\n".join(f"- Line {line_no}: {message}" for line_no, message in e.errors[:10])
+                    more = f"\n- …and {len(e.errors) - 10} more" if len(e.errors) > 10 else ""
+                    st.session_state.create_game_error = f"Invalid TXT format:\n{shown}{more}"
                 except Exception as e:
                     st.session_state.create_game_error = f"An unexpected error: {e}"
             st.rerun()
 
 def host_game_screen():
     game_pin = st.session_state.game_pin
-    game_state = get_game_state(game_pin)
+    game_state = get_screen_state(game_pin)
     if not game_state:
-        st.error("Game not found."); del st.session_state.game_pin; st.rerun()
+        st.error("Game not found."); leave_game(game_pin); del st.session_state.game_pin; st.rerun()
     
-    if game_state['status'] != 'finished':
-        st_autorefresh(interval=1000, key="host_refresher") # Faster refresh for timers
+    watch_for_changes(game_pin, game_state)
 
     c1, c2 = st.columns([1, 2])
     with c1:
@@ -202,9 +273,9 @@ def host_game_screen():
         with st.container(border=True):
             st.header("🎮 Game Info")
             st.markdown(f"<div class='game-pin-display'>{game_pin}</div>", unsafe_allow_html=True)
-            qr = qrcode.make(f"{PLAYER_MODE_URL}?pin={game_pin}"); buf = io.BytesIO(); qr.save(buf, "PNG"); st.image(buf)
+            st.image(make_join_qr_png(game_pin))
         with st.container(border=True):
-            show_leaderboard(game_state.get("players", {}))
+            show_leaderboard(game_state["leaderboard"])
 
     with c2, st.container(border=True):
         status = game_state["status"]
@@ -212,70 +283,40 @@ def host_game_screen():
             st.subheader("Waiting for players...")
             st.info(f"Current Players: {len(game_state.get('players', {}))}")
             if st.button("Start Game", disabled=not game_state.get("players"), use_container_width=True):
-                update_data = {"status": "in_progress", "current_question_index": 0}
-                if game_state.get("quiz_mode") == "timed_paced":
-                    update_data["question_start_time"] = firestore.SERVER_TIMESTAMP
-                update_game_state(game_pin, update_data)
+                get_backend().start_game(game_pin, game_state.get("quiz_mode"))
                 st.rerun()
 
         elif status == "in_progress":
             q_idx = game_state['current_question_index']
-            questions = game_state['questions']
+            questions = get_backend().get_quiz_questions(game_pin)
             question = questions[q_idx]
             is_last_question = q_idx == len(questions) - 1
 
             st.subheader(f"Question {q_idx + 1}/{len(questions)}")
-            st.title(question["question"])
+            st.title(question.question)
             
             if game_state['quiz_mode'] == 'timed_paced':
-                time_per_q = game_state.get("time_per_question", 60)
-                start_time = game_state.get("question_start_time")
-                time_left = time_per_q if not start_time else max(0, time_per_q - (time.time() - start_time.timestamp()))
-                st.progress(time_left / time_per_q, text=f":alarm_clock: {math.ceil(time_left)}s")
-                
-                # --- AUTO-ADVANCE LOGIC ---
-                if time_left == 0:
-                    if is_last_question:
-                        if not game_state.get('calculating'):
-                            update_game_state(game_pin, {"calculating": True})
-                            final_scores = calculate_final_scores(get_game_state(game_pin))
-                            update_game_state(game_pin, {"status": "finished", "players": final_scores, "calculating": firestore.DELETE_FIELD})
-                            st.rerun()
-                    else: # Auto-advance to next question
-                        update_game_state(game_pin, {
-                            "current_question_index": q_idx + 1,
-                            "question_start_time": firestore.SERVER_TIMESTAMP
-                        })
-                        time.sleep(1) # Brief pause for smoother transition
-                        st.rerun()
+                # The server-side scheduler advances the question when this deadline passes.
+                show_countdown(question_deadline(game_state), game_state.get("time_per_question", 60))
             
             st.markdown("---")
-            for i, opt in enumerate(question["options"]): st.markdown(f"{['🟥', '🔷', '🟡', '💚'][i]} {opt}")
+            show_answer_histogram(question, game_state["answer_counts"].get(q_idx, {}), len(game_state.get("players", {})))
             st.markdown("---")
-            if st.toggle("Show Correct Answer"): st.success(f"**Answer:** {question['answer']}")
+            if st.toggle("Show Correct Answer"): st.success(f"**Answer:** {question.answer}")
             
             button_text = "Next Question" if not is_last_question else "Finish Quiz"
             if game_state['quiz_mode'] == 'timed_paced':
                 button_text = "Skip Timer / " + button_text
 
             if st.button(button_text, use_container_width=True, type="primary"):
-                if not is_last_question:
-                    update_data = {"current_question_index": q_idx + 1}
-                    if game_state['quiz_mode'] == 'timed_paced':
-                        update_data["question_start_time"] = firestore.SERVER_TIMESTAMP
-                    update_game_state(game_pin, update_data)
-                else:
-                    current_game_state = get_game_state(game_pin)
-                    final_scores = calculate_final_scores(current_game_state)
-                    update_game_state(game_pin, {"status": "finished", "players": final_scores})
+                get_backend().advance_question(game_pin, q_idx)
                 st.rerun()
         
         elif status == "finished":
             st.balloons(); st.header("🎉 Quiz Finished! 🎉")
             with st.expander("See Question Summary"):
-                for i, q in enumerate(game_state['questions']):
-                    st.markdown(f"**Q{i+1}:** {q['question']} -> **Answer:** {q['answer']}")
-                    st.markdown("---")
+                rows = question_difficulty_rows(get_backend().get_quiz_questions(game_pin), game_state["answer_counts"])
+                st.dataframe(rows, hide_index=True, use_container_width=True)
 
 def player_join_screen():
     with st.container(border=True):
@@ -284,28 +325,29 @@ def player_join_screen():
         name = st.text_input("Enter Your Name:")
         if st.button("Join Game", use_container_width=True):
             if pin and name:
-                success, msg = join_game(pin, name)
+                with st.spinner("Joining…"):
+                    success, msg = get_backend().join_game(pin, name, join_token=get_session_id())
                 if success: st.session_state.game_pin, st.session_state.player_name = pin, name; st.rerun()
                 else: st.error(msg)
             else: st.error("Please enter a Game PIN and your name.")
 
 def player_game_screen():
     game_pin, player_name = st.session_state.game_pin, st.session_state.player_name
-    game_state = get_game_state(game_pin)
+    game_state = get_screen_state(game_pin)
     if not game_state:
         st.error("Game session ended.")
         if st.button("Return to Join Screen"):
+            leave_game(game_pin)
             del st.session_state.game_pin
             del st.session_state.player_name
             st.rerun()
         st.stop()
 
-    if game_state['status'] != 'finished':
-        st_autorefresh(interval=2000, key="player_refresher")
+    watch_for_changes(game_pin, game_state, player_name)
 
     players = game_state.get("players", {})
     st.sidebar.info(f"Playing as: **{player_name}** | Score: **{players.get(player_name, {}).get('score', 0)}**")
-    show_leaderboard(players)
+    show_leaderboard(game_state["leaderboard"], player_name)
 
     with st.container(border=True):
         status = game_state["status"]
@@ -314,7 +356,7 @@ def player_game_screen():
         
         elif status == "in_progress":
             q_idx = game_state['current_question_index']
-            question = game_state["questions"][q_idx]
+            question = get_backend().get_quiz_questions(game_pin)[q_idx]
             quiz_mode = game_state['quiz_mode']
             
             if quiz_mode == 'instructor_paced':
@@ -326,36 +368,35 @@ def player_game_screen():
                     st.info("Waiting for the host to show the next question...")
                 else:
                     st.subheader(f"Question {q_idx + 1}")
-                    st.title(question["question"])
-                    for i, option in enumerate(question["options"]):
-                        if st.button(f"{['🟥', '🔷', '🟡', '💚'][i]} {option}", use_container_width=True, key=f"opt_{i}"):
+                    st.title(question.question)
+                    for i, option in enumerate(question.options):
+                        if st.button(f"{OPTION_MARKERS[i]} {option}", use_container_width=True, key=f"opt_{i}"):
                             st.session_state[f"answered_{q_idx}"] = True
-                            if option == question["answer"]:
+                            is_correct = option == question.answer
+                            get_backend().submit_answer(game_pin, player_name, q_idx, i, correct=is_correct)
+                            if is_correct:
                                 st.balloons()
                                 st.session_state[f"feedback_{q_idx}"] = "✅ Correct!"
-                                update_game_state(game_pin, {f"players.{player_name}.score": firestore.Increment(1)})
                             else:
-                                st.session_state[f"feedback_{q_idx}"] = f"❌ Incorrect! The correct answer was: {question['answer']}"
+                                st.session_state[f"feedback_{q_idx}"] = f"❌ Incorrect! The correct answer was: {question.answer}"
                             st.rerun()
 
             elif quiz_mode == 'timed_paced':
                 is_answered = f"answered_{q_idx}" in st.session_state
-                time_per_q = game_state.get("time_per_question", 60)
-                start_time = game_state.get("question_start_time")
-                time_left = time_per_q if not start_time else max(0, time_per_q - (time.time() - start_time.timestamp()))
-                st.progress(time_left / time_per_q, text=f":alarm_clock: {math.ceil(time_left)}s")
-                is_time_up = time_left == 0
+                deadline = question_deadline(game_state)
+                show_countdown(deadline, game_state.get("time_per_question", 60))
+                is_time_up = deadline is not None and time.time() >= deadline
                 
                 if is_answered or is_time_up:
                     st.info("Waiting for the next question...")
                     if is_time_up and not is_answered: st.warning("Time's up!")
                 else:
                     st.subheader(f"Question {q_idx + 1}")
-                    st.title(question["question"])
-                    for i, option in enumerate(question["options"]):
-                        if st.button(f"{['🟥', '🔷', '🟡', '💚'][i]} {option}", use_container_width=True):
+                    st.title(question.question)
+                    for i, option in enumerate(question.options):
+                        if st.button(f"{OPTION_MARKERS[i]} {option}", use_container_width=True):
                             st.session_state[f"answered_{q_idx}"] = True
-                            update_game_state(game_pin, {f"players.{player_name}.answers.{q_idx}": option})
+                            get_backend().submit_answer(game_pin, player_name, q_idx, i)
                             st.info("Your answer has been recorded!")
                             time.sleep(0.5)
                             st.rerun()
@@ -366,36 +407,84 @@ def player_game_screen():
             
             st.header("🎉 Quiz Finished! 🎉")
             st.subheader("Your Results")
-            sorted_players = sorted(players.items(), key=lambda item: item[1].get('score', 0), reverse=True)
-            rank = next((i for i, (name, _) in enumerate(sorted_players) if name == player_name), None)
+            leaderboard = game_state["leaderboard"]
+            rank, score = leaderboard.rank(player_name)
             
             if rank is not None:
-                st.metric("Your Final Score", players.get(player_name, {}).get('score', 0))
-                st.metric("Your Rank", f"#{rank + 1} of {len(sorted_players)} players")
+                st.metric("Your Final Score", score)
+                st.metric("Your Rank", f"#{rank + 1} of {len(leaderboard)} players")
             
             if game_state['quiz_mode'] == 'timed_paced':
                 with st.expander("See your results"):
-                    for i, q in enumerate(game_state['questions']):
-                        my_ans = players.get(player_name, {}).get('answers', {}).get(str(i))
-                        correct_ans = q['answer']
-                        st.markdown(f"**Q{i+1}:** {q['question']}")
-                        if my_ans:
+                    for i, q in enumerate(get_backend().get_quiz_questions(game_pin)):
+                        my_idx = players.get(player_name, {}).get('answers', {}).get(str(i))
+                        my_ans = q.options[my_idx] if isinstance(my_idx, int) and my_idx < len(q.options) else None
+                        correct_ans = q.answer
+                        st.markdown(f"**Q{i+1}:** {q.question}")
+                        if my_ans is not None:
                             feedback = "✅ Correct" if my_ans == correct_ans else f"❌ Incorrect (Correct: {correct_ans})"
                             st.info(f"You answered: {my_ans} - {feedback}")
                         else:
                             st.warning(f"You did not answer. (Correct: {correct_ans})")
                         st.markdown("---")
 
+def metrics_table(rows):
+    st.dataframe([{k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()} for row in rows], use_container_width=True, hide_index=True)
+
+def admin_screen():
+    """Operator view of this process's metrics registry; open the app with `?admin` to get here."""
+    if not st.session_state.get("admin_authenticated"):
+        with st.container(border=True):
+            st.header("📈 Operator Login")
+            password = st.text_input("Enter Admin Password:", type="password")
+            if st.button("Login", use_container_width=True):
+                if st.secrets.get("ADMIN_PASSWORD") and password == st.secrets["ADMIN_PASSWORD"]:
+                    st.session_state.admin_authenticated = True
+                    st.rerun()
+                else:
+                    st.error("Incorrect password.")
+        return
+
+    st.header("📈 Operator Metrics")
+    reads = REGISTRY.totals("quizzicle_firestore_reads_total", by="pin")
+    writes = REGISTRY.totals("quizzicle_firestore_writes_total", by="pin")
+    snapshot = REGISTRY.snapshot()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Firestore reads", f"{sum(v for _, v in reads):,.0f}")
+    c2.metric("Firestore writes", f"{sum(v for _, v in writes):,.0f}")
+    c3.metric("Collecting for", f"{snapshot['uptime_seconds'] / 60:,.0f} min")
+    if snapshot["dropped_series"]: st.warning(f"{snapshot['dropped_series']} samples dropped: the registry is at its series limit.")
+
+    writes_by_pin = dict(writes)
+    st.subheader("Games by Firestore reads")
+    metrics_table({"pin": pin or "(no game)", "reads": int(v), "writes": int(writes_by_pin.get(pin, 0))} for pin, v in reads[:25])
+    st.subheader("Screen render time")
+    metrics_table(REGISTRY.timings("quizzicle_screen_seconds", by=("screen", "role", "status")))
+    st.subheader("Firestore calls")
+    metrics_table(REGISTRY.timings("quizzicle_firestore_seconds", by=("op", "status")))
+    st.subheader("Joins and retries")
+    metrics_table({"outcome": outcome, "count": int(v)} for outcome, v in REGISTRY.totals("quizzicle_joins_total", by="outcome"))
+    st.caption(f"Join retries: {sum(v for _, v in REGISTRY.totals('quizzicle_join_retries_total', by='pin')):.0f} · "
+               f"advance transaction attempts: {sum(v for _, v in REGISTRY.totals('quizzicle_transaction_attempts_total', by='op')):.0f} · "
+               f"PIN collisions: {sum(v for _, v in REGISTRY.totals('quizzicle_pin_collisions_total', by='pin')):.0f}")
+
+    c1, c2, c3 = st.columns(3)
+    c1.download_button("Prometheus text", REGISTRY.to_prometheus(), "quizzicle_metrics.prom", "text/plain", use_container_width=True)
+    c2.download_button("JSON", REGISTRY.to_json(), "quizzicle_metrics.json", "application/json", use_container_width=True)
+    if c3.button("Refresh", use_container_width=True): st.rerun()
+
 # --- Main App Router ---
 if 'role' not in st.session_state: st.session_state.role = None
 if 'show_host_password_prompt' not in st.session_state: st.session_state.show_host_password_prompt = False
 
-if st.session_state.role is None:
-    if st.session_state.show_host_password_prompt: host_login_screen()
-    else: main_selection_screen()
+if "admin" in st.query_params:
+    run_screen(admin_screen)
+elif st.session_state.role is None:
+    if st.session_state.show_host_password_prompt: run_screen(host_login_screen)
+    else: run_screen(main_selection_screen)
 elif st.session_state.role == "host":
-    if 'game_pin' not in st.session_state: host_create_game_screen()
-    else: host_game_screen()
+    if 'game_pin' not in st.session_state: run_screen(host_create_game_screen)
+    else: run_screen(host_game_screen)
 elif st.session_state.role == "player":
-    if 'game_pin' not in st.session_state: player_join_screen()
-    else: player_game_screen()
+    if 'game_pin' not in st.session_state: run_screen(player_join_screen)
+    else: run_screen(player_game_screen)